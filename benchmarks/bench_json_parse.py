@@ -0,0 +1,110 @@
+"""Micro-benchmark do parser de perguntas com respostas grandes e com ruído
+
+Compara o parse_questions (passada única) com a antiga cascata de safe_json_parse.
+
+Uso: python benchmarks/bench_json_parse.py [--questions 2000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.main import parse_questions
+
+def legacy_fix_json_string(json_str):
+    json_str = re.sub(r',\s*\]', ']', json_str)
+    json_str = re.sub(r',\s*\}', '}', json_str)
+    json_str = re.sub(r'\}\s*\{', '},{', json_str)
+    return json_str
+
+def legacy_safe_json_parse(json_str):
+    """Cascata antiga (até quatro passadas sobre a resposta)"""
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        try:
+            return json.loads(legacy_fix_json_string(json_str))
+        except json.JSONDecodeError:
+            try:
+                start_idx = json_str.find('[')
+                end_idx = json_str.rfind(']') + 1
+                if start_idx != -1 and end_idx > start_idx:
+                    return json.loads(legacy_fix_json_string(json_str[start_idx:end_idx]))
+            except Exception:
+                pass
+            try:
+                pattern = r'\{\s*"pergunta"\s*:\s*"[^"]*"\s*,\s*"resposta"\s*:\s*"[^"]*"\s*\}'
+                matches = re.findall(pattern, json_str)
+                if matches:
+                    return json.loads("[" + ",".join(matches) + "]")
+            except Exception:
+                pass
+    return None
+
+def build_response(num_questions, messy=True, seed=42):
+    """Gera uma resposta de múltipla escolha; a versão com ruído tem cercas de código, vírgulas extras e objetos quebrados
+    
+    Retorna (texto, número de perguntas íntegras que um parser deveria recuperar).
+    """
+    rng = random.Random(seed)
+    objects = []
+    intact = 0
+    for i in range(num_questions):
+        question = {
+            "pergunta": f"Pergunta {i} sobre o conceito {{x{i}}}, com \"aspas\"?",
+            "opcoes": {letter: f"Opção {letter} da pergunta {i}" for letter in "abcde"},
+            "resposta_correta": rng.choice("abcde"),
+            "explicacao": "Explicação detalhada. " * rng.randint(5, 20)
+        }
+        text = json.dumps(question, ensure_ascii=False)
+        roll = rng.random() if messy else 1.0
+        if roll < 0.1:
+            text = text[:-1] + ",}"  # vírgula sobrando
+        elif roll < 0.13:
+            text = text.replace('"explicacao"', '"explicacao" "quebrado"', 1)  # objeto inválido
+        elif roll < 0.15:
+            text = text.replace('\\"aspas\\"', '"aspas"', 1)  # aspas sem escape (objeto desbalanceado)
+        elif roll < 0.17:
+            text = text[:-1]  # '}' ausente (objeto desbalanceado)
+        if roll < 0.1 or roll >= 0.17:
+            intact += 1
+        objects.append(text)
+    
+    if not messy:
+        return "[\n" + ",\n".join(objects) + "\n]", intact
+    body = ",\n".join(objects) + ",\n"
+    return f"Claro! Aqui estão as perguntas:\n```json\n[\n{body}]\n```\nEspero que ajude.", intact
+
+def bench(fn, text, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    
+    for messy in (False, True):
+        text, intact = build_response(args.questions, messy=messy)
+        print(f"\nResposta {'com ruído' if messy else 'limpa'}: {args.questions} objetos ({intact} íntegros), {len(text) / 1024:.0f} KiB")
+        
+        legacy_time, legacy_result = bench(legacy_safe_json_parse, text, args.repeat)
+        legacy_count = len(legacy_result) if isinstance(legacy_result, list) else 0
+        print(f"  safe_json_parse (cascata antiga): {legacy_time * 1000:8.2f} ms, {legacy_count} perguntas recuperadas")
+        
+        new_time, (questions, dropped) = bench(lambda t: parse_questions(t, "multipla_escolha"), text, args.repeat)
+        print(f"  parse_questions (passada única):  {new_time * 1000:8.2f} ms, {len(questions)} perguntas recuperadas, {len(dropped)} descartadas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark da seleção extrativa de trechos em uma transcrição de 3 horas
+
+Mede score_passages (TF-IDF e TextRank) e select_salient_passages em transcrições
+sintéticas com pontuação (Whisper/Vosk) e sem pontuação (legendas automáticas).
+
+Uso: python benchmarks/bench_salience.py [--hours 3] [--budget 8000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.main import estimate_tokens, score_passages, select_salient_passages, split_passages
+
+WORDS_PER_MINUTE = 150
+
+TOPIC_WORDS = {
+    "pt": ("energia força massa aceleração velocidade trabalho potência atrito gravidade "
+           "momento impulso colisão oscilação frequência onda pressão temperatura calor").split(),
+    "en": ("energy force mass acceleration velocity work power friction gravity "
+           "momentum impulse collision oscillation frequency wave pressure temperature heat").split()
+}
+FILLER_WORDS = {
+    "pt": "a o de que e do da em um para com não uma os no se na por mais as dos como mas então".split(),
+    "en": "the of and to a in that is for it as was with be by on not he this are or".split()
+}
+
+def build_transcript(hours, language="pt", punctuated=True, seed=7):
+    """Gera uma transcrição sintética com tópicos que mudam ao longo da aula"""
+    rng = random.Random(seed)
+    topics = TOPIC_WORDS[language]
+    fillers = FILLER_WORDS[language]
+    total_words = int(hours * 60 * WORDS_PER_MINUTE)
+    
+    sentences = []
+    written = 0
+    while written < total_words:
+        focus = topics[(written // 3000) % len(topics)]
+        length = rng.randint(8, 25)
+        words = [focus if rng.random() < 0.1 else rng.choice(topics if rng.random() < 0.2 else fillers)
+                 for _ in range(length)]
+        sentences.append(" ".join(words) + ("." if punctuated else ""))
+        written += length
+    return " ".join(sentences)
+
+def bench(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--budget", type=int, default=8000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    for language in ("pt", "en"):
+        for punctuated in (True, False):
+            transcript = build_transcript(args.hours, language, punctuated)
+            passages = split_passages(transcript)
+            label = f"{language}, {'pontuada' if punctuated else 'sem pontuação'}"
+            print(f"{label}: {len(transcript.split())} palavras, {len(passages)} trechos, "
+                  f"~{estimate_tokens(transcript)} tokens")
+            for method in ("tfidf", "textrank"):
+                elapsed = bench(lambda: select_salient_passages(transcript, args.budget, language, method), args.repeat)
+                selected = select_salient_passages(transcript, args.budget, language, method)
+                print(f"  {method:<9} {elapsed * 1000:8.1f} ms -> ~{estimate_tokens(selected)} tokens")
+            elapsed = bench(lambda: score_passages(passages, None, "tfidf"), args.repeat)
+            print(f"  {'tfidf (idioma detectado)':<9} {elapsed * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
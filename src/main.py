@@ -1,33 +1,305 @@
+import time
+# Início da execução do script, para medir o tempo até a primeira página renderizada
+_SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
 import json
 import re
-from youtube_transcript_api import YouTubeTranscriptApi
-import google.generativeai as genai
 import requests
-import pytube
 import os
 import tempfile
-from pydub import AudioSegment
-import time
 import io
 import base64
 import urllib.parse
 import random
+import math
 import pickle
+import sqlite3
+import hashlib
+import contextlib
+import threading
+import copy
+import sys
+import argparse
+import subprocess
+import gc
+import multiprocessing
+import shutil
+import glob
+import uuid
+import socket
+import heapq
+import itertools
+import contextvars
+import shlex
+import csv
+import importlib
+import importlib.machinery
+import importlib.util
+import collections
+import functools
+import logging
+import http.server
+from xml.sax.saxutils import escape as xml_escape
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from filelock import FileLock, Timeout
 
-# Tentar importar bibliotecas opcionais
+# Funções dos processos filhos do Vosk, em um módulo importável (nome estável para o pickle).
+# Com "streamlit run src/main.py" a pasta src já está no sys.path; importado como src.main
+# (benchmarks), o módulo vem do pacote
 try:
-    import openai
-    OPENAI_AVAILABLE = True
+    import vosk_worker
 except ImportError:
-    OPENAI_AVAILABLE = False
+    from src import vosk_worker
 
-try:
-    from vosk import Model, KaldiRecognizer
-    import wave
-    VOSK_AVAILABLE = True
-except ImportError:
-    VOSK_AVAILABLE = False
+# Bibliotecas de transcrição e geração, importadas apenas no primeiro uso
+PROVIDER_MODULES = {
+    "youtube_transcript_api": "youtube_transcript_api",
+    "genai": "google.generativeai",
+    "generativelanguage": "google.ai.generativelanguage",
+    "pytube": "pytube",
+    "pydub": "pydub",
+    "openai": "openai",
+    "vosk": "vosk",
+    "numpy": "numpy",
+    "sklearn": "sklearn.feature_extraction.text"
+}
+
+# Observabilidade: logs JSON dos spans ("-" para stderr ou caminho de arquivo), porta do
+# endpoint Prometheus (/metrics) e painel de depuração com os tempos por etapa
+SPAN_LOG = os.environ.get("SPOTQUEST_SPAN_LOG", "")
+METRICS_PORT = int(os.environ.get("SPOTQUEST_METRICS_PORT", "0"))
+# Apenas local por padrão; use 0.0.0.0 para expor as métricas em todas as interfaces
+METRICS_HOST = os.environ.get("SPOTQUEST_METRICS_HOST", "127.0.0.1")
+DEBUG_PANEL = os.environ.get("SPOTQUEST_DEBUG_PANEL", "0") == "1"
+
+# Meta de tempo até a primeira página renderizada (partida a frio)
+STARTUP_TARGET_SECONDS = float(os.environ.get("SPOTQUEST_STARTUP_TARGET_SECONDS", "2.0"))
+
+class ProviderRegistry:
+    """Registro dos provedores: importa cada um no primeiro uso e mede o tempo de importação"""
+
+    def __init__(self, modules=PROVIDER_MODULES):
+        self.modules = dict(modules)
+        self.first_render_seconds = None
+        self._loaded = {}
+        self._import_seconds = {}
+        self._available = {}
+        self._lock = threading.RLock()
+
+    def load(self, name):
+        module = self._loaded.get(name)
+        if module is not None:
+            return module
+        with self._lock:
+            if name not in self._loaded:
+                started = time.perf_counter()
+                self._loaded[name] = importlib.import_module(self.modules[name])
+                self._import_seconds[name] = time.perf_counter() - started
+            return self._loaded[name]
+
+    def available(self, name):
+        """Verifica se o provedor está instalado, sem importá-lo (o resultado fica em cache)"""
+        if name in self._loaded:
+            return True
+        if name not in self._available:
+            try:
+                self._available[name] = _find_spec_without_import(self.modules[name]) is not None
+            except (ImportError, ValueError):
+                self._available[name] = False
+        return self._available[name]
+
+    def record_first_render(self, seconds):
+        with self._lock:
+            if self.first_render_seconds is None:
+                self.first_render_seconds = seconds
+
+    def report(self):
+        """Tempo de importação de cada provedor e tempo até a primeira página"""
+        with self._lock:
+            return {
+                "providers": [
+                    {
+                        "provider": name,
+                        "module": module,
+                        "available": self.available(name),
+                        "loaded": name in self._loaded,
+                        "import_seconds": round(self._import_seconds[name], 3) if name in self._import_seconds else None
+                    }
+                    for name, module in self.modules.items()
+                ],
+                "first_render_seconds": round(self.first_render_seconds, 3) if self.first_render_seconds is not None else None,
+                "target_seconds": STARTUP_TARGET_SECONDS
+            }
+
+def _find_spec_without_import(module_name):
+    """Localiza o módulo sem executar os pacotes pais
+    
+    importlib.util.find_spec("a.b.c") importa "a" e "a.b"; aqui os submódulos são procurados
+    diretamente nos diretórios do pacote pai.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name].__spec__
+    top, *parts = module_name.split(".")
+    spec = importlib.util.find_spec(top)
+    for part in parts:
+        if spec is None or not spec.submodule_search_locations:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(part, list(spec.submodule_search_locations))
+    return spec
+
+@st.cache_resource
+def get_provider_registry():
+    """Instância única do registro de provedores, preservada entre as execuções do script"""
+    return ProviderRegistry()
+
+class LazyModule:
+    """Substituto de um módulo (ou de um atributo dele) que importa o provedor no primeiro acesso"""
+
+    def __init__(self, provider, attribute=None):
+        object.__setattr__(self, "_provider", provider)
+        object.__setattr__(self, "_attribute", attribute)
+
+    def _resolve(self):
+        module = get_provider_registry().load(self._provider)
+        return getattr(module, self._attribute) if self._attribute else module
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyModule {self._provider}{'.' + self._attribute if self._attribute else ''}>"
+
+YouTubeTranscriptApi = LazyModule("youtube_transcript_api", "YouTubeTranscriptApi")
+genai = LazyModule("genai")
+glm = LazyModule("generativelanguage")
+pytube = LazyModule("pytube")
+AudioSegment = LazyModule("pydub", "AudioSegment")
+pydub_utils = LazyModule("pydub", "utils")
+np = LazyModule("numpy")
+TfidfVectorizer = LazyModule("sklearn", "TfidfVectorizer")
+
+# Bibliotecas opcionais: apenas verifica a instalação, a importação fica para o primeiro uso
+openai = LazyModule("openai")
+OPENAI_AVAILABLE = get_provider_registry().available("openai")
+
+Model = LazyModule("vosk", "Model")
+KaldiRecognizer = LazyModule("vosk", "KaldiRecognizer")
+VOSK_AVAILABLE = get_provider_registry().available("vosk")
+
+# Diretório base dos caches persistentes (compartilhado entre sessões e processos)
+CACHE_DIR = os.environ.get("SPOTQUEST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "spotquest_cache"))
+
+# Limites do cache de transcrições
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.environ.get("SPOTQUEST_TRANSCRIPT_CACHE_MAX_MB", "512")) * 1024 * 1024
+TRANSCRIPT_CACHE_MAX_AGE = int(os.environ.get("SPOTQUEST_TRANSCRIPT_CACHE_MAX_DAYS", "30")) * 24 * 3600
+# Transcrições sintéticas (inventadas pela IA) expiram logo, para que os métodos reais sejam tentados de novo
+SYNTHETIC_TRANSCRIPT_CACHE_MAX_AGE = int(os.environ.get("SPOTQUEST_SYNTHETIC_TRANSCRIPT_CACHE_HOURS", "6")) * 3600
+
+# Armazenamento dos áudios baixados: cota de disco e espera máxima pela trava de um download
+AUDIO_STORE_MAX_BYTES = int(os.environ.get("SPOTQUEST_AUDIO_STORE_MAX_MB", "2048")) * 1024 * 1024
+AUDIO_STORE_LOCK_TIMEOUT = 900
+
+# Cliente HTTP compartilhado: timeouts (segundos), novas tentativas e conexões simultâneas por host
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("SPOTQUEST_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("SPOTQUEST_HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.environ.get("SPOTQUEST_HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.environ.get("SPOTQUEST_HTTP_BACKOFF_FACTOR", "0.5"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("SPOTQUEST_HTTP_POOL_MAXSIZE", "10"))
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Áudio: decodificação em fluxo direto para o reconhecedor (sem MP3/WAV intermediários)
+AUDIO_STREAMING = os.environ.get("SPOTQUEST_AUDIO_STREAMING", "1") == "1"
+VOSK_SAMPLE_RATE = 16000
+VOSK_MODEL_PATH = os.environ.get("SPOTQUEST_VOSK_MODEL_PATH", os.path.join(os.path.expanduser("~"), "vosk-model-small-pt"))
+
+# Modelos Vosk por idioma e pré-carregamento na inicialização do processo
+VOSK_MODEL_PATHS = {"pt": VOSK_MODEL_PATH}
+VOSK_WARMUP = os.environ.get("SPOTQUEST_VOSK_WARMUP", "0") == "1"
+
+# Transcrição Vosk paralela: número de processos (1 = serial) e duração alvo de cada trecho
+VOSK_WORKERS = int(os.environ.get("SPOTQUEST_VOSK_WORKERS", "1"))
+VOSK_CHUNK_SECONDS = int(os.environ.get("SPOTQUEST_VOSK_CHUNK_SECONDS", "120"))
+
+# Whisper: limite de upload da API e divisão em trechos paralelos com sobreposição
+WHISPER_MAX_UPLOAD_BYTES = 24 * 1024 * 1024  # margem abaixo do limite de 25 MB
+WHISPER_CHUNKED = os.environ.get("SPOTQUEST_WHISPER_CHUNKED", "0") == "1"
+WHISPER_CHUNK_SECONDS = int(os.environ.get("SPOTQUEST_WHISPER_CHUNK_SECONDS", "600"))
+WHISPER_CHUNK_OVERLAP_SECONDS = 2
+WHISPER_CHUNK_BITRATE = "64k"
+WHISPER_WORKERS = int(os.environ.get("SPOTQUEST_WHISPER_WORKERS", "4"))
+
+# Transcrição de áudio com o Gemini: segmentos, paralelismo e cota (requisições/tokens por minuto)
+GEMINI_SEGMENT_SECONDS = 60
+GEMINI_SEGMENT_WORKERS = int(os.environ.get("SPOTQUEST_GEMINI_SEGMENT_WORKERS", "4"))
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get("SPOTQUEST_GEMINI_RPM", "15"))
+GEMINI_TOKENS_PER_MINUTE = int(os.environ.get("SPOTQUEST_GEMINI_TPM", "1000000"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.environ.get("SPOTQUEST_OPENAI_RPM", "50"))
+
+# Agendador das chamadas às APIs: novas tentativas espaçadas quando a API responde 429
+SCHEDULER_MAX_RETRIES = int(os.environ.get("SPOTQUEST_SCHEDULER_MAX_RETRIES", "4"))
+SCHEDULER_BACKOFF_SECONDS = float(os.environ.get("SPOTQUEST_SCHEDULER_BACKOFF_SECONDS", "2"))
+
+# Modelo e versão do prompt usados na geração de perguntas
+# (incremente a versão sempre que os prompts de generate_questions mudarem)
+QUESTION_MODEL = "gemini-1.5-flash"
+QUESTION_PROMPT_VERSION = 1
+
+# Transcrições longas: acima deste tamanho as perguntas são geradas por janelas (map-reduce)
+LONG_TRANSCRIPT_TOKENS = int(os.environ.get("SPOTQUEST_LONG_TRANSCRIPT_TOKENS", "30000"))
+LONG_TRANSCRIPT_WINDOW_TOKENS = int(os.environ.get("SPOTQUEST_LONG_TRANSCRIPT_WINDOW_TOKENS", "8000"))
+LONG_TRANSCRIPT_WORKERS = int(os.environ.get("SPOTQUEST_LONG_TRANSCRIPT_WORKERS", "4"))
+
+# Orçamento de tokens da transcrição enviada ao modelo (0 = sem limite)
+TRANSCRIPT_TOKEN_BUDGET = int(os.environ.get("SPOTQUEST_TRANSCRIPT_TOKEN_BUDGET", "0"))
+
+# Seleção extrativa dos trechos mais relevantes quando a transcrição excede o orçamento
+SALIENCE_METHOD = os.environ.get("SPOTQUEST_SALIENCE_METHOD", "tfidf")  # "tfidf", "textrank" ou "truncate"
+SALIENCE_PASSAGE_WORDS = 40
+
+# Modo banco de questões: muitos lotes em paralelo e remoção de perguntas quase repetidas
+BANK_MAX_QUESTIONS = int(os.environ.get("SPOTQUEST_BANK_MAX_QUESTIONS", "500"))
+BANK_BATCH_SIZE = 15
+BANK_OVERGENERATION = 1.3  # margem para compensar as repetidas removidas
+BANK_WORKERS = int(os.environ.get("SPOTQUEST_BANK_WORKERS", "4"))
+BANK_DUPLICATE_THRESHOLD = float(os.environ.get("SPOTQUEST_BANK_DUPLICATE_THRESHOLD", "0.8"))
+# Tamanho máximo (MB) da exportação baixada pela interface; acima disso, usar o subcomando export
+BANK_EXPORT_MAX_MB = float(os.environ.get("SPOTQUEST_BANK_EXPORT_MAX_MB", "20"))
+
+# Saída estruturada: esquema JSON declarado na chamada e novas tentativas apenas para os itens inválidos
+QUESTION_SCHEMA_MODE = os.environ.get("SPOTQUEST_QUESTION_SCHEMA_MODE", "1") == "1"
+QUESTION_REPAIR_ATTEMPTS = int(os.environ.get("SPOTQUEST_QUESTION_REPAIR_ATTEMPTS", "2"))
+
+# Tarefas em segundo plano (a interface consulta o andamento periodicamente)
+JOB_WORKERS = int(os.environ.get("SPOTQUEST_JOB_WORKERS", "2"))
+JOB_RETENTION = int(os.environ.get("SPOTQUEST_JOB_RETENTION_HOURS", "6")) * 3600
+JOB_POLL_SECONDS = 2
+JOB_STAGES = ["queued", "transcript", "compress", "questions", "save"]
+JOB_STAGE_LABELS = {
+    "queued": "Na fila",
+    "transcript": "Obtendo a transcrição",
+    "compress": "Otimizando a transcrição",
+    "questions": "Gerando perguntas",
+    "save": "Salvando no banco de questões",
+    "done": "Concluída"
+}
+
+# Fila durável para workers em várias máquinas (o arquivo deve estar em um disco compartilhado)
+QUEUE_PATH = os.environ.get("SPOTQUEST_QUEUE_PATH", os.path.join(CACHE_DIR, "queue.sqlite3"))
+QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get("SPOTQUEST_QUEUE_VISIBILITY_TIMEOUT", "600"))
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("SPOTQUEST_QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_RETRY_DELAY = 30
+QUEUE_POLL_SECONDS = 5
+
+# Limites do cache de perguntas geradas
+QUESTION_CACHE_MAX_ENTRIES = int(os.environ.get("SPOTQUEST_QUESTION_CACHE_MAX_ENTRIES", "256"))
+QUESTION_CACHE_TTL = int(os.environ.get("SPOTQUEST_QUESTION_CACHE_TTL_HOURS", "24")) * 3600
 
 def apply_custom_css():
     # CSS personalizado (simplificado)
@@ -94,6 +366,12 @@ if 'question_type' not in st.session_state:
     st.session_state.question_type = "dissertativa"
 if 'transcript' not in st.session_state:
     st.session_state.transcript = ""
+if 'transcript_method' not in st.session_state:
+    st.session_state.transcript_method = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'last_trace_id' not in st.session_state:
+    st.session_state.last_trace_id = None
 
 # Função para salvar as chaves de API
 def save_api_keys(gemini_key=None, openai_key=None):
@@ -140,6 +418,241 @@ def load_api_keys():
     
     return {'gemini': '', 'openai': ''}
 
+# Etapas instrumentadas: duração, bytes/tokens, resultado e método vencedor da cadeia de fallback
+SPAN_HISTORY = 2000
+SPAN_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def start_trace():
+    """Inicia um novo trace no contexto atual e retorna o seu id"""
+    trace_id = uuid.uuid4().hex[:16]
+    get_tracer().current_trace.set(trace_id)
+    return trace_id
+
+class Span:
+    """Medição de uma etapa; atributos extras (bytes, tokens, method...) são definidos com set()"""
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = dict(attributes)
+        self.outcome = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class Tracer:
+    """Registra os spans recentes e agrega as métricas exportadas no formato do Prometheus"""
+
+    def __init__(self, history=SPAN_HISTORY, buckets=SPAN_DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=history)
+        self._durations = {}
+        self._counters = {}
+        self._logger = logging.getLogger("spotquest.spans")
+        # Trace (execução do pipeline para um vídeo) ao qual os spans da thread atual pertencem.
+        # Fica na instância, não no módulo: o Streamlit reexecuta o script em um __main__ novo a
+        # cada interação, e uma variável de módulo seria outra a cada execução
+        self.current_trace = contextvars.ContextVar("trace_id", default=None)
+
+    def record(self, span, started_at, duration):
+        entry = {
+            "trace_id": self.current_trace.get(),
+            "stage": span.stage,
+            "outcome": span.outcome,
+            "started_at": round(started_at, 3),
+            "duration_seconds": round(duration, 4),
+            **span.attributes
+        }
+        with self._lock:
+            self._recent.append(entry)
+            key = (span.stage, span.outcome)
+            histogram = self._durations.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += duration
+            histogram["count"] += 1
+            for field in ("bytes", "tokens"):
+                if isinstance(span.attributes.get(field), (int, float)):
+                    counter = (f"spotquest_stage_{field}_total", (("stage", span.stage),))
+                    self._counters[counter] = self._counters.get(counter, 0) + span.attributes[field]
+            if span.attributes.get("winner"):
+                counter = ("spotquest_transcript_method_wins_total", (("method", span.attributes["winner"]),))
+                self._counters[counter] = self._counters.get(counter, 0) + 1
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def recent(self, trace_id=None):
+        with self._lock:
+            return [dict(e) for e in self._recent if trace_id is None or e["trace_id"] == trace_id]
+
+    def percentiles(self):
+        """p50/p95 da duração de cada etapa entre os spans recentes"""
+        by_stage = {}
+        for entry in self.recent():
+            by_stage.setdefault(entry["stage"], []).append(entry["duration_seconds"])
+        summary = []
+        for stage, durations in sorted(by_stage.items()):
+            durations.sort()
+            summary.append({
+                "stage": stage,
+                "count": len(durations),
+                "p50_seconds": durations[len(durations) // 2],
+                "p95_seconds": durations[min(len(durations) - 1, math.ceil(len(durations) * 0.95) - 1)]
+            })
+        return summary
+
+    def prometheus(self):
+        """Métricas no formato de texto do Prometheus"""
+        lines = [
+            "# HELP spotquest_stage_duration_seconds Duração de cada etapa do pipeline",
+            "# TYPE spotquest_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            for (stage, outcome), histogram in sorted(self._durations.items()):
+                labels = f'stage="{_prom_escape(stage)}",outcome="{_prom_escape(outcome)}"'
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'spotquest_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'spotquest_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f"spotquest_stage_duration_seconds_sum{{{labels}}} {histogram['sum']:.6f}")
+                lines.append(f"spotquest_stage_duration_seconds_count{{{labels}}} {histogram['count']}")
+            counters = sorted(self._counters.items())
+        
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            label_text = ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+def _prom_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+@st.cache_resource
+def get_tracer():
+    """Instância única do registro de spans, compartilhada entre as sessões"""
+    tracer = Tracer()
+    if SPAN_LOG:
+        # Logs JSON, um span por linha
+        handler = logging.StreamHandler(sys.stderr) if SPAN_LOG == "-" else logging.FileHandler(SPAN_LOG, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger("spotquest.spans")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return tracer
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    """Mede a etapa; o resultado é "error" se uma exceção escapar e "ok" se não for definido"""
+    current = Span(stage, attributes)
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield current
+    except GeneratorExit:
+        # Gerador abandonado pelo consumidor (ex.: streaming interrompido)
+        current.outcome = "cancelled"
+        raise
+    except BaseException:
+        current.outcome = "error"
+        raise
+    finally:
+        current.outcome = current.outcome or "ok"
+        get_tracer().record(current, started_at, time.perf_counter() - started)
+
+def traced(stage, measure=None):
+    """Decorador que mede a função como um span; retorno vazio conta como outcome "empty"
+    
+    measure(result, *args, **kwargs) pode devolver atributos extras (bytes, tokens...).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage) as current:
+                result = fn(*args, **kwargs)
+                if measure:
+                    try:
+                        current.set(**measure(result, *args, **kwargs))
+                    except Exception:
+                        pass
+                if not result:
+                    current.outcome = "empty"
+                return result
+        return wrapper
+    return decorator
+
+def _measure_text(result, *args, **kwargs):
+    return {"tokens": estimate_tokens(result)} if isinstance(result, str) else {}
+
+def _measure_audio_transcription(result, audio_file, *args, **kwargs):
+    return {"bytes": os.path.getsize(audio_file), **_measure_text(result)}
+
+def _measure_audio_file(result, *args, **kwargs):
+    return {"bytes": os.path.getsize(result)} if result else {}
+
+def _measure_questions(result, *args, **kwargs):
+    return {"items": len(result)} if result else {}
+
+def _measure_parse(result, text, *args, **kwargs):
+    questions, dropped = result
+    return {"tokens": estimate_tokens(text), "items": len(questions), "dropped": len(dropped)}
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Expõe /metrics no formato de texto do Prometheus"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def render_prometheus_metrics():
+    """Spans agregados mais o estado do agendador de APIs e do coalescedor de chamadas"""
+    lines = [get_tracer().prometheus()]
+    
+    queues = get_api_scheduler().snapshot()
+    if queues:
+        lines.append("# TYPE spotquest_api_queue_depth gauge")
+        lines.append("# TYPE spotquest_api_calls_total counter")
+        lines.append("# TYPE spotquest_api_throttled_total counter")
+        lines.append("# TYPE spotquest_api_wait_seconds_total counter")
+        for q in queues:
+            labels = f'provider="{q["provider"]}",key="{q["key"]}"'
+            lines.append(f"spotquest_api_queue_depth{{{labels}}} {q['queue_depth']}")
+            lines.append(f"spotquest_api_calls_total{{{labels}}} {q['calls']}")
+            lines.append(f"spotquest_api_throttled_total{{{labels}}} {q['throttled']}")
+            lines.append(f"spotquest_api_wait_seconds_total{{{labels}}} {q['wait_seconds']:.3f}")
+    
+    flights = get_single_flight().stats()
+    lines.append("# TYPE spotquest_single_flight_executions_total counter")
+    lines.append(f"spotquest_single_flight_executions_total {flights['executions']}")
+    lines.append("# TYPE spotquest_single_flight_coalesced_total counter")
+    lines.append(f"spotquest_single_flight_coalesced_total {flights['coalesced']}")
+    return "\n".join(lines) + "\n"
+
+def start_metrics_server(port, host=None):
+    """Serve /metrics em uma thread em segundo plano"""
+    server = http.server.ThreadingHTTPServer((host or METRICS_HOST, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="spotquest-metrics").start()
+    return server
+
+@st.cache_resource
+def get_metrics_server(port):
+    """Servidor de métricas único por processo (iniciado apenas uma vez entre as execuções do script)"""
+    return start_metrics_server(port)
+
+@traced("extract_video_id")
 def extract_video_id(youtube_url):
     youtube_regex = (
         r'(https?://)?(www\.)?'
@@ -151,43 +664,194 @@ def extract_video_id(youtube_url):
         return youtube_match.group(6)
     return None
 
+@st.cache_resource
+def get_http_session():
+    """Sessão HTTP única do processo, com keep-alive, pool por host e novas tentativas com backoff"""
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        # Jitter evita que várias sessões repitam as requisições ao mesmo tempo
+        backoff_jitter=HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    # pool_block faz o pool_maxsize valer como limite: sem ele, o urllib3 abre conexões extras
+    # quando o pool do host está ocupado e só as descarta depois. Com ele, quem passar do limite
+    # espera uma conexão voltar, por isso respostas em streaming precisam ser sempre fechadas
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=True,
+        max_retries=retry
+    )
+    
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({'User-Agent': DEFAULT_USER_AGENT})
+    return session
+
+def http_get(url, read_timeout=None, **kwargs):
+    """Faz um GET pelo cliente compartilhado com timeouts de conexão e leitura separados"""
+    timeout = (HTTP_CONNECT_TIMEOUT, read_timeout or HTTP_READ_TIMEOUT)
+    return get_http_session().get(url, timeout=timeout, **kwargs)
+
+def open_http_stream(url, headers=None, read_timeout=30):
+    """Abre uma resposta HTTP em modo streaming, falhando se o status não for 200"""
+    response = http_get(url, read_timeout=read_timeout, headers=headers, stream=True)
+    if response.status_code != 200:
+        response.close()
+        raise ValueError(f"Status HTTP {response.status_code}")
+    return response
+
+# Instâncias públicas do Invidious usadas como fallback
+INVIDIOUS_MIRRORS = [
+    "https://invidious.snopyta.org",
+    "https://vid.puffyan.us",
+    "https://yewtu.be",
+    "https://invidious.kavin.rocks"
+]
+
+class MirrorHealth:
+    """Pontuação de saúde dos espelhos: EWMA da latência e contagem de falhas consecutivas
+    
+    As estatísticas são agrupadas por host, então URLs diferentes do mesmo serviço
+    compartilham a mesma pontuação.
+    """
+
+    def __init__(self, alpha=0.3, max_failures=3, cooldown=600, default_latency=5.0):
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.default_latency = default_latency
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, mirror):
+        host = urllib.parse.urlsplit(mirror).netloc or mirror
+        return self._stats.setdefault(host, {"latency": None, "failures": 0, "last_failure": 0.0})
+
+    def record_success(self, mirror, latency):
+        with self._lock:
+            entry = self._entry(mirror)
+            if entry["latency"] is None:
+                entry["latency"] = latency
+            else:
+                entry["latency"] = self.alpha * latency + (1 - self.alpha) * entry["latency"]
+            entry["failures"] = 0
+
+    def record_failure(self, mirror):
+        with self._lock:
+            entry = self._entry(mirror)
+            entry["failures"] += 1
+            entry["last_failure"] = time.time()
+
+    def is_available(self, mirror):
+        """Espelhos com muitas falhas seguidas são ignorados até o fim do período de espera"""
+        with self._lock:
+            entry = self._entry(mirror)
+            if entry["failures"] < self.max_failures:
+                return True
+            return time.time() - entry["last_failure"] > self.cooldown
+
+    def order(self, mirrors):
+        """Ordena os espelhos disponíveis do mais rápido/saudável para o mais lento"""
+        available = [m for m in mirrors if self.is_available(m)]
+        with self._lock:
+            def score(mirror):
+                entry = self._entry(mirror)
+                latency = entry["latency"] if entry["latency"] is not None else self.default_latency
+                return latency * (1 + entry["failures"])
+            return sorted(available, key=score)
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self._stats)
+
+@st.cache_resource
+def get_mirror_health():
+    """Instância única das estatísticas de saúde dos espelhos, compartilhada entre as sessões"""
+    return MirrorHealth()
+
+def race_mirrors(mirrors, fetch, discard=None):
+    """Consulta os espelhos em paralelo e retorna o primeiro resultado válido
+    
+    fetch(mirror) deve retornar o resultado ou lançar uma exceção. Resultados que
+    chegam depois do vencedor são entregues a discard() para liberar recursos.
+    """
+    health = get_mirror_health()
+    candidates = health.order(mirrors)
+    if not candidates:
+        return None
+    
+    cancelled = threading.Event()
+    lock = threading.Lock()
+    winner = []
+    
+    def attempt(mirror):
+        if cancelled.is_set():
+            return None
+        started = time.monotonic()
+        try:
+            value = fetch(mirror)
+        except Exception:
+            health.record_failure(mirror)
+            return None
+        health.record_success(mirror, time.monotonic() - started)
+        
+        with lock:
+            if not winner:
+                winner.append(value)
+                cancelled.set()
+                return value
+        
+        # Chegou depois do vencedor: descartar
+        if discard:
+            discard(value)
+        return None
+    
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    futures = [executor.submit(attempt, mirror) for mirror in candidates]
+    try:
+        for future in as_completed(futures):
+            value = future.result()
+            if value is not None:
+                return value
+        return None
+    finally:
+        # Não esperar pelos perdedores: eles terminam em segundo plano e são descartados
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def get_video_info_via_proxy(video_id):
     """Obtém informações do vídeo usando serviços proxy"""
     try:
-        # Lista de serviços proxy para tentar
-        proxy_services = [
-            f"https://invidious.snopyta.org/api/v1/videos/{video_id}",
-            f"https://vid.puffyan.us/api/v1/videos/{video_id}",
-            f"https://yewtu.be/api/v1/videos/{video_id}",
-            f"https://invidious.kavin.rocks/api/v1/videos/{video_id}"
-        ]
+        def fetch_info(mirror):
+            response = http_get(f"{mirror}/api/v1/videos/{video_id}")
+            response.raise_for_status()
+            video_data = response.json()
+            return {
+                "title": video_data.get("title", ""),
+                "author": video_data.get("author", ""),
+                "description": video_data.get("description", ""),
+                "keywords": video_data.get("keywords", []),
+                "lengthSeconds": video_data.get("lengthSeconds", 0)
+            }
         
-        for service_url in proxy_services:
-            try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(service_url, headers=headers, timeout=10)
-                
-                if response.status_code == 200:
-                    video_data = response.json()
-                    return {
-                        "title": video_data.get("title", ""),
-                        "author": video_data.get("author", ""),
-                        "description": video_data.get("description", ""),
-                        "keywords": video_data.get("keywords", []),
-                        "lengthSeconds": video_data.get("lengthSeconds", 0)
-                    }
-            except Exception as e:
-                continue
+        # Consultar todos os espelhos ao mesmo tempo; o mais rápido vence
+        video_info = race_mirrors(INVIDIOUS_MIRRORS, fetch_info)
+        if video_info:
+            return video_info
         
         # Tentar método alternativo - scraping básico
         try:
             url = f"https://www.youtube.com/watch?v={video_id}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
+            response = http_get(url)
             
             if response.status_code == 200:
                 # Extrair título
@@ -211,79 +875,65 @@ def get_video_info_via_proxy(video_id):
         st.error(f"Erro ao obter informações do vídeo via proxy: {str(e)}")
         return None
 
-def download_audio_via_proxy(video_id):
-    """Tenta baixar o áudio do vídeo usando serviços proxy"""
+def open_proxy_audio_stream(video_id):
+    """Abre o fluxo de áudio (itag 140) no espelho do Invidious que responder primeiro"""
+    return race_mirrors(
+        INVIDIOUS_MIRRORS,
+        lambda mirror: open_http_stream(f"{mirror}/latest_version?id={video_id}&itag=140"),
+        discard=lambda r: r.close()
+    )
+
+def download_audio_via_proxy(video_id, temp_dir):
+    """Tenta baixar o áudio do vídeo para temp_dir usando serviços proxy"""
     try:
         with st.spinner("Tentando baixar áudio via serviços alternativos..."):
-            # Criar diretório temporário
-            temp_dir = tempfile.mkdtemp()
-            
-            # Lista de serviços proxy para tentar
-            proxy_services = [
-                f"https://invidious.snopyta.org/latest_version?id={video_id}&itag=140",
-                f"https://vid.puffyan.us/latest_version?id={video_id}&itag=140",
-                f"https://yewtu.be/latest_version?id={video_id}&itag=140"
-            ]
+            def save_stream(response, path):
+                with response, open(path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        if chunk:
+                            f.write(chunk)
+                return path
             
-            for service_url in proxy_services:
+            # Disputar os espelhos do Invidious pela primeira resposta válida
+            response = open_proxy_audio_stream(video_id)
+            if response:
                 try:
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                    }
-                    response = requests.get(service_url, headers=headers, stream=True, timeout=30)
+                    # Salvar o arquivo de áudio
+                    audio_file = save_stream(response, os.path.join(temp_dir, f"{video_id}.mp4"))
                     
-                    if response.status_code == 200:
-                        # Salvar o arquivo de áudio
-                        audio_file = os.path.join(temp_dir, f"{video_id}.mp4")
-                        with open(audio_file, 'wb') as f:
-                            for chunk in response.iter_content(chunk_size=1024):
-                                if chunk:
-                                    f.write(chunk)
-                        
-                        # Converter para MP3
-                        mp3_file = os.path.join(temp_dir, f"{video_id}.mp3")
-                        audio = AudioSegment.from_file(audio_file)
-                        audio.export(mp3_file, format="mp3", bitrate="128k")
-                        
-                        # Remover o arquivo original
-                        os.remove(audio_file)
-                        
-                        return mp3_file
+                    # Converter para MP3
+                    mp3_file = os.path.join(temp_dir, f"{video_id}.mp3")
+                    audio = AudioSegment.from_file(audio_file)
+                    audio.export(mp3_file, format="mp3", bitrate="128k")
+                    
+                    # Remover o arquivo original
+                    os.remove(audio_file)
+                    
+                    return mp3_file
                 except Exception as e:
-                    continue
+                    pass
             
             # Método alternativo - usar um serviço de download de YouTube
+            def open_download_service(service_url):
+                headers = {'Referer': 'https://www.youtube.com/'}
+                response = http_get(service_url, headers=headers)
+                response.raise_for_status()
+                
+                # Extrair URL de download
+                download_url_match = re.search(r'href="(https://.*?\.mp3)"', response.text)
+                if not download_url_match:
+                    raise ValueError("Link de download não encontrado")
+                return open_http_stream(download_url_match.group(1), headers=headers)
+            
             try:
                 download_services = [
                     f"https://api.vevioz.com/api/button/mp3/{video_id}",
                     f"https://api.download-lagu-mp3.com/@api/button/mp3/{video_id}"
                 ]
                 
-                for service_url in download_services:
-                    try:
-                        headers = {
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                            'Referer': 'https://www.youtube.com/'
-                        }
-                        response = requests.get(service_url, headers=headers, timeout=10)
-                        
-                        if response.status_code == 200:
-                            # Extrair URL de download
-                            download_url_match = re.search(r'href="(https://.*?\.mp3)"', response.text)
-                            if download_url_match:
-                                download_url = download_url_match.group(1)
-                                
-                                # Baixar o arquivo
-                                audio_response = requests.get(download_url, headers=headers, stream=True, timeout=30)
-                                if audio_response.status_code == 200:
-                                    mp3_file = os.path.join(temp_dir, f"{video_id}.mp3")
-                                    with open(mp3_file, 'wb') as f:
-                                        for chunk in audio_response.iter_content(chunk_size=1024):
-                                            if chunk:
-                                                f.write(chunk)
-                                    return mp3_file
-                    except Exception as e:
-                        continue
+                response = race_mirrors(download_services, open_download_service, discard=lambda r: r.close())
+                if response:
+                    return save_stream(response, os.path.join(temp_dir, f"{video_id}.mp3"))
             except Exception as e:
                 pass
             
@@ -292,7 +942,80 @@ def download_audio_via_proxy(video_id):
         st.error(f"Erro ao baixar áudio via proxy: {str(e)}")
         return None
 
+class SingleFlight:
+    """Coalesce chamadas concorrentes com a mesma chave em uma única execução
+    
+    A primeira chamada executa a função; as que chegam enquanto ela está em andamento
+    esperam e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
+
+@st.cache_resource
+def get_single_flight():
+    """Instância única do coalescedor de chamadas, compartilhada entre as sessões"""
+    return SingleFlight()
+
+def single_flight(stage, video_id, fn, variant=None):
+    """Executa fn uma única vez por (etapa, vídeo, variante) entre todas as chamadas simultâneas
+    
+    variant separa chamadas cujo resultado depende de algo além do vídeo (ex.: chaves disponíveis).
+    """
+    return get_single_flight().do((stage, video_id, variant), fn)
+
 def get_video_info(video_id):
+    """Obtém informações básicas do vídeo (chamadas simultâneas para o mesmo vídeo são coalescidas)"""
+    return single_flight("metadata", video_id, lambda: fetch_video_info(video_id))
+
+@traced("get_video_info")
+def fetch_video_info(video_id):
     """Obtém informações básicas do vídeo"""
     try:
         yt = pytube.YouTube(f"https://www.youtube.com/watch?v={video_id}")
@@ -315,13 +1038,160 @@ def get_video_info(video_id):
         st.error("Não foi possível obter informações do vídeo.")
         return None
 
+class AudioStore:
+    """Áudios baixados em disco, por vídeo e formato, com cota total e despejo LRU
+    
+    O acesso é protegido por travas de arquivo, então sessões, threads e processos
+    diferentes nunca baixam o mesmo áudio ao mesmo tempo.
+    """
+
+    def __init__(self, root, max_bytes=AUDIO_STORE_MAX_BYTES, lock_timeout=AUDIO_STORE_LOCK_TIMEOUT):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, video_id, fmt):
+        return os.path.join(self.root, f"{video_id}.{fmt}")
+
+    def _lock(self, path, timeout=None):
+        return FileLock(path + ".lock", timeout=self.lock_timeout if timeout is None else timeout)
+
+    def get(self, video_id, fmt="mp3"):
+        """Retorna o caminho do áudio armazenado (ou None), marcando-o como usado recentemente"""
+        path = self.path_for(video_id, fmt)
+        if not os.path.exists(path):
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return path
+
+    def get_or_create(self, video_id, fmt, producer):
+        """Retorna o áudio armazenado ou chama producer(work_dir) para gerá-lo uma única vez
+        
+        producer grava em work_dir (um diretório temporário, sempre removido ao final) e retorna
+        o caminho do arquivo gerado, que é movido para o armazenamento.
+        """
+        path = self.path_for(video_id, fmt)
+        with self._lock(path):
+            if os.path.exists(path):
+                os.utime(path)
+                return path
+            
+            work_dir = tempfile.mkdtemp(prefix="spotquest-audio-")
+            try:
+                produced = producer(work_dir)
+                if not produced:
+                    return None
+                
+                # Mover de forma atômica para que leitores nunca vejam um arquivo incompleto
+                # (nome único: um processo que esperava por uma trava já removida não colide)
+                partial = f"{path}.{uuid.uuid4().hex[:8]}.part"
+                shutil.move(produced, partial)
+                os.replace(partial, path)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        
+        self.evict(keep=path)
+        return path
+
+    @contextlib.contextmanager
+    def lease(self, video_id, fmt="mp3"):
+        """Impede que o despejo remova o áudio do vídeo enquanto o bloco estiver em execução
+        
+        Vale também para um áudio que só será baixado dentro do bloco. O arrendamento é um
+        arquivo com o PID do dono, criado sob a trava do áudio; o de um processo morto é ignorado.
+        """
+        path = self.path_for(video_id, fmt)
+        lease_path = f"{path}.lease-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        with self._lock(path):
+            open(lease_path, "w").close()
+        try:
+            yield path
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(lease_path)
+
+    def _leased(self, path):
+        """Verifica (sob a trava do áudio) se há arrendamentos vivos, removendo os abandonados"""
+        leased = False
+        for lease_path in glob.glob(glob.escape(path) + ".lease-*"):
+            pid = int(lease_path.rsplit(".lease-", 1)[1].split("-")[0])
+            try:
+                os.kill(pid, 0)
+                leased = True
+            except ProcessLookupError:
+                with contextlib.suppress(OSError):
+                    os.remove(lease_path)
+            except PermissionError:
+                leased = True
+        return leased
+
+    def evict(self, keep=None):
+        """Remove os áudios menos usados recentemente até respeitar a cota de disco
+        
+        Áudios arrendados são mantidos; a trava de cada áudio removido também é apagada, assim
+        como as travas que ficaram sem áudio (downloads que falharam).
+        """
+        entries = []
+        orphan_locks = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".lock"):
+                if not os.path.exists(path[:-len(".lock")]):
+                    orphan_locks.append(path[:-len(".lock")])
+                continue
+            if name.endswith(".part") or ".lease-" in name:
+                continue
+            with contextlib.suppress(OSError):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                # Não remover um áudio que outro processo está gravando ou usando
+                with self._lock(path, timeout=0):
+                    if self._leased(path):
+                        continue
+                    os.remove(path)
+                    self._remove_lock_file(path)
+                total -= size
+            except (Timeout, OSError):
+                continue
+        
+        for path in orphan_locks:
+            with contextlib.suppress(Timeout, OSError):
+                with self._lock(path, timeout=0):
+                    if not os.path.exists(path) and not self._leased(path):
+                        self._remove_lock_file(path)
+
+    @staticmethod
+    def _remove_lock_file(path):
+        with contextlib.suppress(OSError):
+            os.remove(path + ".lock")
+
+@st.cache_resource
+def get_audio_store():
+    """Armazenamento único de áudios do processo (o conteúdo em disco é compartilhado entre processos)"""
+    return AudioStore(os.path.join(CACHE_DIR, "audio"))
+
+@traced("download_audio", _measure_audio_file)
 def download_audio(video_id):
-    """Baixa apenas o áudio do vídeo do YouTube"""
+    """Retorna o áudio do vídeo em MP3, baixando-o apenas se ainda não estiver armazenado"""
+    return single_flight(
+        "audio", video_id,
+        lambda: get_audio_store().get_or_create(video_id, "mp3", lambda work_dir: fetch_audio_file(video_id, work_dir))
+    )
+
+def fetch_audio_file(video_id, temp_dir):
+    """Baixa apenas o áudio do vídeo do YouTube para temp_dir"""
     try:
         with st.spinner("Baixando áudio do vídeo..."):
-            # Criar diretório temporário
-            temp_dir = tempfile.mkdtemp()
-            
             # Baixar o áudio
             yt = pytube.YouTube(f"https://www.youtube.com/watch?v={video_id}")
             audio_stream = yt.streams.filter(only_audio=True).first()
@@ -330,7 +1200,7 @@ def download_audio(video_id):
                 st.error("Não foi possível encontrar uma stream de áudio para este vídeo.")
                 
                 # Tentar método alternativo
-                proxy_audio = download_audio_via_proxy(video_id)
+                proxy_audio = download_audio_via_proxy(video_id, temp_dir)
                 if proxy_audio:
                     st.success("✅ Áudio baixado via serviço alternativo!")
                     return proxy_audio
@@ -340,20 +1210,12 @@ def download_audio(video_id):
             # Baixar o arquivo
             audio_file = audio_stream.download(output_path=temp_dir)
             
-            # Converter para MP3 (opcional, para reduzir tamanho)
-            mp3_file = os.path.join(temp_dir, f"{video_id}.mp3")
-            audio = AudioSegment.from_file(audio_file)
-            audio.export(mp3_file, format="mp3", bitrate="128k")
-            
-            # Remover o arquivo original
-            os.remove(audio_file)
-            
-            return mp3_file
+            return convert_to_mp3(audio_file, os.path.join(temp_dir, f"{video_id}.mp3"))
     except Exception as e:
         st.warning(f"Erro ao baixar áudio via pytube: {str(e)}")
         
         # Tentar método alternativo
-        proxy_audio = download_audio_via_proxy(video_id)
+        proxy_audio = download_audio_via_proxy(video_id, temp_dir)
         if proxy_audio:
             st.success("✅ Áudio baixado via serviço alternativo!")
             return proxy_audio
@@ -361,136 +1223,755 @@ def download_audio(video_id):
         st.error("Não foi possível baixar o áudio do vídeo.")
         return None
 
-def transcribe_with_whisper(audio_file, api_key):
-    """Transcreve o áudio usando a API Whisper da OpenAI"""
+def convert_to_mp3(audio_file, mp3_file):
+    """Converte o áudio baixado para MP3 (reduz o tamanho) e remove o arquivo original"""
+    with span("audio_conversion", bytes=os.path.getsize(audio_file)):
+        audio = AudioSegment.from_file(audio_file)
+        audio.export(mp3_file, format="mp3", bitrate="128k")
+    os.remove(audio_file)
+    return mp3_file
+
+def _normalize_word(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+def dedupe_seam(previous_text, next_text, max_words=30):
+    """Remove do início de next_text as palavras que repetem o final de previous_text"""
+    previous_words = previous_text.split()
+    next_words = next_text.split()
+    previous_norm = [_normalize_word(w) for w in previous_words]
+    next_norm = [_normalize_word(w) for w in next_words]
+    
+    for k in range(min(max_words, len(previous_words), len(next_words)), 0, -1):
+        if previous_norm[-k:] == next_norm[:k]:
+            return " ".join(next_words[k:])
+    return next_text
+
+def merge_whisper_chunks(chunk_results, overlap_seconds):
+    """Junta os segmentos dos trechos na ordem, descartando o texto repetido nas sobreposições
+    
+    chunk_results é uma lista de (início do trecho em segundos, segmentos), onde cada segmento
+    tem start, end (relativos ao trecho) e text.
+    """
+    merged = []
+    for index, (chunk_start, segments) in enumerate(chunk_results):
+        for segment in segments:
+            start = chunk_start + segment["start"]
+            end = chunk_start + segment["end"]
+            text = segment["text"].strip()
+            
+            if index > 0:
+                # O trecho anterior já cobriu a região de sobreposição
+                if end <= chunk_start + overlap_seconds:
+                    continue
+                if merged and start < chunk_start + overlap_seconds:
+                    text = dedupe_seam(merged[-1]["text"], text)
+            
+            if text:
+                merged.append({"start": start, "end": end, "text": text})
+    return merged
+
+def _whisper_client(api_key):
+    return openai.OpenAI(api_key=api_key)
+
+def transcribe_whisper_chunk(client, audio_bytes, filename="audio.mp3", timestamps=False):
+    """Envia um único arquivo para a API Whisper"""
+    response = get_api_scheduler().call(
+        "openai", client.api_key, client.audio.transcriptions.create,
+        model="whisper-1",
+        file=(filename, audio_bytes, "audio/mpeg"),
+        language="pt",  # Pode ser alterado para outros idiomas
+        response_format="verbose_json" if timestamps else "json"
+    )
+    if not timestamps:
+        return response.text
+    return [{"start": s.start, "end": s.end, "text": s.text} for s in (response.segments or [])]
+
+def probe_audio_seconds(audio_file):
+    """Duração do áudio em segundos, lida pelo ffprobe sem decodificar o arquivo"""
+    return float(pydub_utils.mediainfo(audio_file)["duration"])
+
+def export_audio_chunk(audio_file, start_seconds, duration_seconds, bitrate=WHISPER_CHUNK_BITRATE):
+    """Recorta um trecho com o ffmpeg (-ss/-t) em MP3 mono, decodificando apenas esse trecho"""
+    process = subprocess.run(
+        [AudioSegment.converter, "-hide_banner", "-loglevel", "error",
+         "-ss", f"{start_seconds:.3f}", "-t", f"{duration_seconds:.3f}", "-i", audio_file,
+         "-vn", "-ac", "1", "-b:a", bitrate, "-f", "mp3", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg terminou com código {process.returncode} ao recortar o áudio: {process.stderr.decode(errors='replace')[-200:]}")
+    return process.stdout
+
+def transcribe_with_whisper_chunked(audio_file, api_key, on_progress=None):
+    """Transcreve em trechos paralelos, com sobreposição, respeitando o limite de upload
+    
+    Retorna a transcrição com marcações [mm:ss] por segmento. Cada trecho é recortado pelo
+    ffmpeg a partir do arquivo, então o áudio nunca é decodificado inteiro na memória.
+    """
+    client = _whisper_client(api_key)
+    duration_ms = int(probe_audio_seconds(audio_file) * 1000)
+    
+    # Duração máxima de um trecho para caber no limite de upload com a taxa de bits escolhida
+    bitrate_bps = int(WHISPER_CHUNK_BITRATE.rstrip("k")) * 1000
+    max_seconds = WHISPER_MAX_UPLOAD_BYTES * 8 // bitrate_bps - WHISPER_CHUNK_OVERLAP_SECONDS
+    chunk_ms = min(WHISPER_CHUNK_SECONDS, max_seconds) * 1000
+    overlap_ms = WHISPER_CHUNK_OVERLAP_SECONDS * 1000
+    starts = list(range(0, duration_ms, chunk_ms))
+    
+    def transcribe_chunk(start_ms):
+        audio_bytes = export_audio_chunk(audio_file, start_ms / 1000, (chunk_ms + overlap_ms) / 1000)
+        return transcribe_whisper_chunk(client, audio_bytes, f"chunk_{start_ms}.mp3", timestamps=True)
+    
+    results = [None] * len(starts)
+    with ThreadPoolExecutor(max_workers=WHISPER_WORKERS) as executor:
+        futures = {submit_in_context(executor, transcribe_chunk, start_ms): i for i, start_ms in enumerate(starts)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i] = (starts[i] / 1000, future.result())
+            if on_progress:
+                on_progress(done, len(starts))
+    
+    segments = merge_whisper_chunks(results, WHISPER_CHUNK_OVERLAP_SECONDS)
+    return "\n".join(f"{format_timestamp(s['start'])} {s['text']}" for s in segments)
+
+@traced("transcribe_with_whisper", _measure_audio_transcription)
+def transcribe_with_whisper(audio_file, api_key, chunked=None):
+    """Transcreve o áudio usando a API Whisper da OpenAI
+    
+    Arquivos acima do limite de upload (ou com chunked=True) são divididos em trechos paralelos.
+    """
     if not OPENAI_AVAILABLE:
         st.error("A biblioteca OpenAI não está instalada. Instale com: pip install openai")
         return None
     
     try:
         with st.spinner("Transcrevendo áudio com Whisper..."):
-            # Configurar a API
-            openai.api_key = api_key
+            if chunked is None:
+                chunked = os.path.getsize(audio_file) > WHISPER_MAX_UPLOAD_BYTES or WHISPER_CHUNKED
+            
+            if chunked:
+                progress = st.progress(0.0, text="Transcrevendo trechos do áudio...")
+                return transcribe_with_whisper_chunked(
+                    audio_file, api_key,
+                    on_progress=lambda done, total: progress.progress(done / total, text=f"Trecho {done}/{total} concluído")
+                )
             
             # Abrir o arquivo de áudio
             with open(audio_file, "rb") as file:
-                # Fazer a transcrição
-                response = openai.Audio.transcribe(
-                    model="whisper-1",
-                    file=file,
-                    language="pt"  # Pode ser alterado para outros idiomas
-                )
-                
-                # Retornar o texto transcrito
-                return response["text"]
+                # Fazer a transcrição e retornar o texto
+                return transcribe_whisper_chunk(_whisper_client(api_key), file.read(), os.path.basename(audio_file))
     except Exception as e:
         st.error(f"Erro ao transcrever com Whisper: {str(e)}")
         return None
 
-def transcribe_with_vosk(audio_file):
-    """Transcreve o áudio usando Vosk (offline)"""
-    if not VOSK_AVAILABLE:
-        st.error("A biblioteca Vosk não está instalada. Instale com: pip install vosk")
-        return None
-    
+def iter_file_bytes(path, chunk_size=64 * 1024):
+    """Lê um arquivo em blocos, sem carregá-lo inteiro na memória"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def open_audio_byte_stream(video_id):
+    """Abre o áudio do vídeo como um fluxo de bytes direto da rede (sem salvar em disco)"""
     try:
-        with st.spinner("Transcrevendo áudio com Vosk (isso pode levar alguns minutos)..."):
-            # Verificar se o modelo já foi baixado
-            model_path = os.path.join(os.path.expanduser("~"), "vosk-model-small-pt")
-            
-            if not os.path.exists(model_path):
-                st.info("Baixando modelo Vosk para português (isso será feito apenas uma vez)...")
-                # Aqui você precisaria implementar o download do modelo
-                # Por simplicidade, vamos assumir que o usuário já baixou o modelo
-                st.error("Modelo Vosk não encontrado. Por favor, baixe o modelo em: https://alphacephei.com/vosk/models")
-                return None
-            
-            # Carregar o modelo
-            model = Model(model_path)
-            
-            # Converter MP3 para WAV (Vosk trabalha melhor com WAV)
-            wav_file = audio_file.replace(".mp3", ".wav")
-            sound = AudioSegment.from_mp3(audio_file)
-            sound.export(wav_file, format="wav")
-            
-            # Abrir o arquivo WAV
-            wf = wave.open(wav_file, "rb")
-            
-            # Criar reconhecedor
-            rec = KaldiRecognizer(model, wf.getframerate())
-            rec.SetWords(True)
-            
-            # Processar o áudio
-            results = []
-            while True:
-                data = wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                if rec.AcceptWaveform(data):
-                    part_result = json.loads(rec.Result())
-                    results.append(part_result.get("text", ""))
-            
-            part_result = json.loads(rec.FinalResult())
-            results.append(part_result.get("text", ""))
-            
-            # Juntar os resultados
-            return " ".join([r for r in results if r])
+        yt = pytube.YouTube(f"https://www.youtube.com/watch?v={video_id}")
+        audio_streams = yt.streams.filter(only_audio=True)
+        # WebM/Opus pode ser decodificado a partir de um pipe sem precisar de seek
+        audio_stream = audio_streams.filter(mime_type="audio/webm").order_by("abr").desc().first() or audio_streams.first()
+        if audio_stream:
+            return open_http_stream(audio_stream.url)
     except Exception as e:
-        st.error(f"Erro ao transcrever com Vosk: {str(e)}")
-        return None
+        st.warning(f"Erro ao abrir o fluxo de áudio via pytube: {str(e)}")
+    
+    return open_proxy_audio_stream(video_id)
 
-def transcribe_with_gemini(audio_file, api_key):
-    """Usa o Gemini para transcrever o áudio (método alternativo)"""
+def decode_to_pcm(byte_chunks, sample_rate=VOSK_SAMPLE_RATE, block_size=8000):
+    """Decodifica um fluxo de áudio em PCM 16 bits mono com uma única passada do ffmpeg
+    
+    Os bytes de entrada são enviados ao ffmpeg por uma thread e o PCM é lido em blocos,
+    então o uso de memória é limitado e nenhum arquivo intermediário é criado.
+    """
+    process = subprocess.Popen(
+        [AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    
+    def feed():
+        try:
+            for chunk in byte_chunks:
+                if chunk:
+                    process.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            # O consumidor parou de ler; o ffmpeg já foi encerrado
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+    
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
     try:
-        with st.spinner("Processando áudio com Gemini..."):
-            # Configurar a API
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            
-            # Converter o áudio para um formato mais compacto
-            sound = AudioSegment.from_file(audio_file)
-            
-            # Dividir o áudio em segmentos de 1 minuto
-            segment_length = 60 * 1000  # 1 minuto em milissegundos
-            segments = [sound[i:i+segment_length] for i in range(0, len(sound), segment_length)]
+        while True:
+            block = process.stdout.read(block_size)
+            if not block:
+                break
+            yield block
+        
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg terminou com código {process.returncode} ao decodificar o áudio")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        feeder.join(timeout=5)
+
+def recognize_pcm_with_vosk(model, pcm_blocks, sample_rate=VOSK_SAMPLE_RATE):
+    """Alimenta o reconhecedor Vosk incrementalmente com blocos PCM e retorna o texto"""
+    rec = KaldiRecognizer(model, sample_rate)
+    rec.SetWords(True)
+    
+    results = []
+    for block in pcm_blocks:
+        if rec.AcceptWaveform(block):
+            part_result = json.loads(rec.Result())
+            results.append(part_result.get("text", ""))
+    
+    part_result = json.loads(rec.FinalResult())
+    results.append(part_result.get("text", ""))
+    
+    # Juntar os resultados
+    return " ".join([r for r in results if r])
+
+class VoskModelRegistry:
+    """Modelos Vosk carregados sob demanda e compartilhados (uma instância por caminho)"""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._path_locks = {}
+
+    def get(self, model_path):
+        """Retorna o modelo já carregado ou o carrega uma única vez, mesmo com chamadas concorrentes"""
+        model = self._models.get(model_path)
+        if model is not None:
+            return model
+        
+        with self._lock:
+            path_lock = self._path_locks.setdefault(model_path, threading.Lock())
+        with path_lock:
+            model = self._models.get(model_path)
+            if model is None:
+                model = Model(model_path)
+                self._models[model_path] = model
+            return model
+
+    def warm_up(self, model_paths):
+        """Carrega antecipadamente os modelos existentes em disco"""
+        for model_path in model_paths:
+            if os.path.exists(model_path):
+                self.get(model_path)
+
+    def unload(self, model_path=None):
+        """Libera um modelo (ou todos) para reduzir o uso de memória"""
+        with self._lock:
+            if model_path is None:
+                self._models.clear()
+            else:
+                self._models.pop(model_path, None)
+        gc.collect()
+
+    def loaded(self):
+        return list(self._models)
+
+@st.cache_resource
+def get_vosk_registry():
+    """Registro único de modelos Vosk do processo, compartilhado entre sessões e workers"""
+    return VoskModelRegistry()
+
+def get_vosk_model(language="pt"):
+    """Retorna o modelo Vosk do idioma, carregando-o apenas no primeiro uso"""
+    return get_vosk_registry().get(VOSK_MODEL_PATHS[language])
+
+@st.cache_resource
+def warm_up_vosk_models():
+    """Pré-carrega os modelos Vosk em segundo plano (executado uma vez por processo)"""
+    if not VOSK_AVAILABLE:
+        return None
+    thread = threading.Thread(
+        target=get_vosk_registry().warm_up,
+        args=(list(VOSK_MODEL_PATHS.values()),),
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+def unload_vosk_models(language=None):
+    """Descarrega o modelo de um idioma (ou todos) em situações de pouca memória"""
+    get_vosk_registry().unload(VOSK_MODEL_PATHS[language] if language else None)
+
+def vosk_model_exists(language="pt"):
+    """Verifica se o modelo Vosk foi baixado, avisando o usuário caso contrário"""
+    if os.path.exists(VOSK_MODEL_PATHS[language]):
+        return True
+    st.info("Baixando modelo Vosk para português (isso será feito apenas uma vez)...")
+    # Aqui você precisaria implementar o download do modelo
+    # Por simplicidade, vamos assumir que o usuário já baixou o modelo
+    st.error("Modelo Vosk não encontrado. Por favor, baixe o modelo em: https://alphacephei.com/vosk/models")
+    return False
+
+def format_timestamp(seconds):
+    """Formata segundos no padrão [mm:ss] usado nas transcrições"""
+    minutes, secs = divmod(int(seconds), 60)
+    return f"[{minutes:02d}:{secs:02d}]"
+
+def find_silence_split_points(pcm, chunk_seconds=VOSK_CHUNK_SECONDS, sample_rate=VOSK_SAMPLE_RATE,
+                              search_seconds=5, window_ms=300, step_ms=50):
+    """Divide o PCM em trechos de ~chunk_seconds, cortando no ponto mais silencioso perto de cada limite
+    
+    Retorna uma lista de (início_ms, fim_ms).
+    """
+    bytes_per_ms = sample_rate * 2 // 1000
+    total_ms = len(pcm) // bytes_per_ms
+    chunk_ms = int(chunk_seconds * 1000)
+    search_ms = int(search_seconds * 1000)
+    
+    def rms_at(ms):
+        window = pcm[ms * bytes_per_ms:(ms + window_ms) * bytes_per_ms]
+        return AudioSegment(data=bytes(window), sample_width=2, frame_rate=sample_rate, channels=1).rms
+    
+    points = [0]
+    target = chunk_ms
+    # Não criar um último trecho muito curto
+    while target + chunk_ms // 4 < total_ms:
+        start = max(points[-1] + window_ms, target - search_ms)
+        end = min(total_ms - window_ms, target + search_ms)
+        if start >= end:
+            break
+        quietest = min(range(start, end, step_ms), key=rms_at)
+        split = quietest + window_ms // 2
+        points.append(split)
+        target = split + chunk_ms
+    points.append(total_ms)
+    
+    return list(zip(points, points[1:]))
+
+def recognize_pcm_with_vosk_parallel(pcm, workers=None, language="pt", chunk_seconds=VOSK_CHUNK_SECONDS):
+    """Reconhece o PCM em trechos paralelos (um reconhecedor por processo) e junta na ordem original
+    
+    Retorna (transcrição com marcações [mm:ss], lista de palavras com tempos absolutos).
+    """
+    workers = workers or VOSK_WORKERS or os.cpu_count() or 1
+    bytes_per_ms = VOSK_SAMPLE_RATE * 2 // 1000
+    chunks = [
+        (start_ms / 1000, bytes(pcm[start_ms * bytes_per_ms:end_ms * bytes_per_ms]))
+        for start_ms, end_ms in find_silence_split_points(pcm, chunk_seconds)
+    ]
+    
+    model_path = VOSK_MODEL_PATHS[language]
+    # Carregar o modelo no processo pai antes do fork para que os filhos o compartilhem
+    vosk_worker.share_model(get_vosk_model(language))
+    
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=vosk_worker.init_worker,
+        initargs=(model_path, VOSK_SAMPLE_RATE)
+    ) as executor:
+        results = list(executor.map(vosk_worker.recognize_chunk, chunks))
+    
+    lines = []
+    all_words = []
+    for (offset_seconds, _), (text, words) in zip(chunks, results):
+        all_words.extend(words)
+        if text:
+            start = words[0]["start"] if words else offset_seconds
+            lines.append(f"{format_timestamp(start)} {text}")
+    
+    return "\n".join(lines), all_words
+
+@traced("transcribe_with_vosk", _measure_audio_transcription)
+def transcribe_with_vosk(audio_file, workers=None):
+    """Transcreve o áudio usando Vosk (offline)"""
+    if not VOSK_AVAILABLE:
+        st.error("A biblioteca Vosk não está instalada. Instale com: pip install vosk")
+        return None
+    
+    try:
+        with st.spinner("Transcrevendo áudio com Vosk (isso pode levar alguns minutos)..."):
+            # Verificar se o modelo já foi baixado
+            if not vosk_model_exists():
+                return None
             
-            # Transcrever cada segmento
-            transcriptions = []
-            for i, segment in enumerate(segments):
-                st.write(f"Processando segmento {i+1}/{len(segments)}...")
-                
-                # Exportar o segmento para um arquivo temporário
-                segment_file = os.path.join(tempfile.mkdtemp(), f"segment_{i}.mp3")
-                segment.export(segment_file, format="mp3", bitrate="64k")
-                
-                # Descrever o áudio para o Gemini
-                prompt = f"""
-                Este é um segmento de áudio de um vídeo do YouTube.
-                Por favor, transcreva o conteúdo falado neste áudio.
-                Se houver múltiplos falantes, indique as mudanças de falante.
-                Transcreva exatamente o que é dito, incluindo hesitações e pausas.
-                """
+            # Reutilizar o modelo já carregado no processo
+            model = get_vosk_model()
+            
+            # Decodificar direto para PCM 16 kHz mono, sem gerar um WAV intermediário
+            pcm_blocks = decode_to_pcm(iter_file_bytes(audio_file))
+            
+            workers = workers or VOSK_WORKERS
+            if workers > 1:
+                # Modo paralelo: decodificar tudo e dividir entre os núcleos
+                transcript, _ = recognize_pcm_with_vosk_parallel(b"".join(pcm_blocks), workers)
+                return transcript
+            return recognize_pcm_with_vosk(model, pcm_blocks)
+    except Exception as e:
+        st.error(f"Erro ao transcrever com Vosk: {str(e)}")
+        return None
+
+@traced("transcribe_with_vosk_stream", _measure_text)
+def transcribe_with_vosk_stream(video_id, workers=None):
+    """Transcreve com Vosk enquanto o áudio é baixado
+    
+    Os bytes recebidos também são gravados em um arquivo temporário: se o Vosk não produzir
+    texto, o áudio completo vai para o AudioStore e o próximo método não o baixa de novo.
+    """
+    if not VOSK_AVAILABLE:
+        st.error("A biblioteca Vosk não está instalada. Instale com: pip install vosk")
+        return None
+    
+    try:
+        with st.spinner("Transcrevendo áudio com Vosk enquanto é baixado (isso pode levar alguns minutos)..."):
+            if not vosk_model_exists():
+                return None
+            
+            model = get_vosk_model()
+            
+            response = open_audio_byte_stream(video_id)
+            if not response:
+                st.error("Não foi possível abrir o fluxo de áudio do vídeo.")
+                return None
+            
+            temp_dir = tempfile.mkdtemp()
+            raw_path = os.path.join(temp_dir, f"{video_id}.stream")
+            complete = threading.Event()
+            
+            def tee(chunks, raw):
+                for chunk in chunks:
+                    raw.write(chunk)
+                    yield chunk
+                complete.set()
+            
+            transcript = None
+            try:
+                with response, open(raw_path, "wb") as raw:
+                    pcm_blocks = decode_to_pcm(tee(response.iter_content(chunk_size=64 * 1024), raw))
+                    
+                    workers = workers or VOSK_WORKERS
+                    if workers > 1:
+                        transcript, _ = recognize_pcm_with_vosk_parallel(b"".join(pcm_blocks), workers)
+                    else:
+                        transcript = recognize_pcm_with_vosk(model, pcm_blocks)
+            finally:
+                if not transcript and complete.is_set():
+                    # Guardar o áudio já baixado para os métodos seguintes (ex.: Gemini)
+                    get_audio_store().get_or_create(
+                        video_id, "mp3",
+                        lambda work_dir: convert_to_mp3(raw_path, os.path.join(work_dir, f"{video_id}.mp3"))
+                    )
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            return transcript
+    except Exception as e:
+        st.error(f"Erro ao transcrever com Vosk: {str(e)}")
+        return None
+
+class RateLimiter:
+    """Limitador do lado do cliente para requisições e tokens por minuto (token bucket)"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(
+            self.requests_per_minute,
+            self._request_allowance + elapsed * self.requests_per_minute / 60
+        )
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                self.tokens_per_minute,
+                self._token_allowance + elapsed * self.tokens_per_minute / 60
+            )
+
+    def try_acquire(self, tokens=0):
+        """Consome a cota se houver; caso contrário retorna quantos segundos esperar (0 = liberado)"""
+        if self.tokens_per_minute:
+            # Uma requisição maior que a cota inteira nunca seria liberada
+            tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            self._refill()
+            paused = self._paused_until - time.monotonic()
+            if paused > 0:
+                return paused
+            missing_requests = 1 - self._request_allowance
+            missing_tokens = tokens - self._token_allowance if self.tokens_per_minute else 0
+            if missing_requests <= 0 and missing_tokens <= 0:
+                self._request_allowance -= 1
+                if self.tokens_per_minute:
+                    self._token_allowance -= tokens
+                return 0
+            return max(
+                missing_requests * 60 / self.requests_per_minute,
+                missing_tokens * 60 / self.tokens_per_minute if self.tokens_per_minute else 0
+            )
+
+    def acquire(self, tokens=0):
+        """Bloqueia até haver cota para uma requisição com o número estimado de tokens"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Suspende a liberação de cota (a API respondeu 429) e zera a reserva acumulada"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._request_allowance = min(self._request_allowance, 0.0)
+
+# Prioridades das chamadas às APIs (menor valor é atendido primeiro)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Define a prioridade das chamadas às APIs feitas dentro do bloco"""
+    current_priority = get_api_scheduler().current_priority
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """Envia fn ao executor preservando o contexto atual (inclusive a prioridade das chamadas)"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def is_rate_limit_error(error):
+    """Identifica respostas 429 / cota esgotada do Gemini e da OpenAI"""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ in ("ResourceExhausted", "RateLimitError", "TooManyRequests")
+
+# Limites por provedor: (requisições por minuto, tokens por minuto)
+API_RATE_LIMITS = {
+    "gemini": (GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE),
+    "openai": (OPENAI_REQUESTS_PER_MINUTE, None)
+}
+
+class ApiScheduler:
+    """Agendador das chamadas ao Gemini e à OpenAI, compartilhado por todas as sessões
+    
+    Cada chave de API tem seu token bucket e uma fila de prioridade: chamadas interativas
+    passam à frente das de lote, e respostas 429 pausam a chave e são repetidas com espera
+    exponencial em vez de derrubar o método de transcrição atual.
+    """
+
+    def __init__(self, limits=None, max_retries=SCHEDULER_MAX_RETRIES, backoff_seconds=SCHEDULER_BACKOFF_SECONDS):
+        self.limits = limits or API_RATE_LIMITS
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._limiters = {}
+        self._queues = {}
+        self._stats = {}
+        # Prioridade das chamadas feitas no contexto atual. Fica na instância compartilhada,
+        # não no módulo, que o Streamlit recria a cada execução do script
+        self.current_priority = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+    @staticmethod
+    def _key(provider, api_key):
+        # A chave de API nunca aparece nas métricas, apenas um prefixo do seu hash
+        return provider, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+
+    def _wait_turn(self, key, tokens, priority):
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        with self._cond:
+            if key not in self._limiters:
+                self._limiters[key] = RateLimiter(*self.limits[key[0]])
+                self._queues[key] = []
+                self._stats[key] = {"calls": 0, "throttled": 0, "errors": 0, "max_depth": 0, "wait_seconds": 0.0}
+            limiter = self._limiters[key]
+            queue = self._queues[key]
+            stats = self._stats[key]
+            heapq.heappush(queue, ticket)
+            stats["max_depth"] = max(stats["max_depth"], len(queue))
+            try:
+                while True:
+                    timeout = None
+                    if queue[0] == ticket:
+                        timeout = limiter.try_acquire(tokens)
+                        if timeout <= 0:
+                            break
+                    # Quem não está à frente da fila espera ser avisado quando ela andar
+                    self._cond.wait(timeout)
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                stats["wait_seconds"] += time.monotonic() - started
+                self._cond.notify_all()
+
+    def _record(self, key, field):
+        with self._cond:
+            self._stats[key][field] += 1
+
+    def call(self, provider, api_key, fn, *args, tokens=0, priority=None, **kwargs):
+        """Executa fn(*args, **kwargs) quando houver cota para a chave, repetindo em caso de 429"""
+        if priority is None:
+            priority = self.current_priority.get()
+        key = self._key(provider, api_key)
+        
+        for attempt in range(self.max_retries + 1):
+            self._wait_turn(key, tokens, priority)
+            try:
+                result = fn(*args, **kwargs)
+                self._record(key, "calls")
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    self._record(key, "errors")
+                    raise
+                self._record(key, "throttled")
+                self._limiters[key].pause(self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def snapshot(self):
+        """Métricas por chave: profundidade atual das filas, chamadas, 429 recebidos e espera total"""
+        with self._cond:
+            return [
+                {
+                    "provider": provider,
+                    "key": key_hash,
+                    "queue_depth": len(self._queues[(provider, key_hash)]),
+                    "queue_depth_interactive": sum(1 for p, _ in self._queues[(provider, key_hash)] if p <= PRIORITY_INTERACTIVE),
+                    **stats
+                }
+                for (provider, key_hash), stats in self._stats.items()
+            ]
+
+@st.cache_resource
+def get_api_scheduler():
+    """Instância única do agendador de chamadas às APIs, compartilhada entre as sessões"""
+    return ApiScheduler()
+
+class ScheduledModel:
+    """Modelo do Gemini cujas chamadas passam pelo agendador"""
+
+    def __init__(self, model, api_key):
+        self.model = model
+        self.api_key = api_key
+
+    def generate_content(self, contents, tokens=None, **kwargs):
+        if tokens is None:
+            parts = [contents] if isinstance(contents, str) else [c for c in contents if isinstance(c, str)]
+            tokens = sum(estimate_tokens(part) for part in parts)
+        return get_api_scheduler().call("gemini", self.api_key, self.model.generate_content, contents, tokens=tokens, **kwargs)
+
+@st.cache_resource
+def get_gemini_client(api_key):
+    """Cliente do Gemini ligado a uma chave, reaproveitado entre as chamadas com essa chave"""
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+def get_gemini_model(api_key, model_name=QUESTION_MODEL):
+    """Retorna o modelo do Gemini ligado à chave informada e ao agendador
+    
+    genai.configure é global ao processo: com sessões e tarefas simultâneas usando chaves
+    diferentes, uma chamada poderia sair com a chave de outra. Cada modelo usa o seu cliente.
+    """
+    model = genai.GenerativeModel(model_name)
+    # A biblioteca não aceita um cliente por modelo na API pública. GenerativeModel só cria o
+    # cliente global em generate_content quando _client é None, então um cliente definido aqui
+    # é usado em todas as chamadas (inclusive com stream=True). Depende de um atributo privado,
+    # verificado na versão fixada em requirements.txt (google-generativeai==0.8.4); se ele
+    # mudar, falhar aqui é melhor do que enviar requisições com a chave de outra sessão
+    if getattr(model, "_client", ...) is not None:
+        raise RuntimeError(
+            "google-generativeai mudou: GenerativeModel._client não existe mais; "
+            "revise get_gemini_model antes de atualizar a biblioteca"
+        )
+    model._client = get_gemini_client(api_key)
+    return ScheduledModel(model, api_key)
+
+@traced("transcribe_with_gemini", _measure_audio_transcription)
+def transcribe_with_gemini(audio_file, api_key, on_progress=None):
+    """Usa o Gemini para transcrever o áudio (método alternativo)
+    
+    Os segmentos são enviados como áudio em paralelo, respeitando o limite de cota,
+    e remontados na ordem original. on_progress(concluídos, total) é chamado a cada segmento.
+    """
+    try:
+        with st.spinner("Processando áudio com Gemini..."):
+            # Configurar a API
+            model = get_gemini_model(api_key, "gemini-1.5-flash")
+            
+            # Dividir o áudio em segmentos de 1 minuto; cada um é recortado pelo ffmpeg ao ser
+            # enviado, sem decodificar o arquivo inteiro na memória
+            duration = probe_audio_seconds(audio_file)
+            segments = [
+                (start, min(GEMINI_SEGMENT_SECONDS, duration - start))
+                for start in range(0, math.ceil(duration), GEMINI_SEGMENT_SECONDS)
+                if duration - start >= 0.5
+            ]
+            
+            prompt = """
+            Este é um segmento de áudio de um vídeo do YouTube.
+            Por favor, transcreva o conteúdo falado neste áudio.
+            Se houver múltiplos falantes, indique as mudanças de falante.
+            Transcreva exatamente o que é dito, incluindo hesitações e pausas.
+            """
+            
+            def transcribe_segment(segment):
+                start, seconds = segment
+                audio_bytes = export_audio_chunk(audio_file, start, seconds, bitrate="64k")
                 
-                # Não podemos enviar o áudio diretamente para o Gemini,
-                # então vamos usar uma descrição do conteúdo
-                response = model.generate_content(prompt)
+                # O Gemini conta ~32 tokens por segundo de áudio, mais o prompt
+                estimated_tokens = int(seconds * 32) + len(prompt) // 4
                 
-                # Adicionar à lista de transcrições
-                transcriptions.append(response.text)
+                response = model.generate_content([
+                    prompt,
+                    {"mime_type": "audio/mp3", "data": audio_bytes}
+                ], tokens=estimated_tokens)
+                return response.text
+            
+            # Transcrever os segmentos em paralelo
+            transcriptions = [None] * len(segments)
+            progress = st.progress(0.0, text=f"Processando {len(segments)} segmentos...")
+            with ThreadPoolExecutor(max_workers=GEMINI_SEGMENT_WORKERS) as executor:
+                futures = {submit_in_context(executor, transcribe_segment, segment): i for i, segment in enumerate(segments)}
+                for done, future in enumerate(as_completed(futures), 1):
+                    i = futures[future]
+                    transcriptions[i] = f"{format_timestamp(i * GEMINI_SEGMENT_SECONDS)} {future.result().strip()}"
+                    progress.progress(done / len(segments), text=f"Segmento {done}/{len(segments)} concluído")
+                    if on_progress:
+                        on_progress(done, len(segments))
             
-            # Juntar todas as transcrições
-            return " ".join(transcriptions)
+            # Juntar todas as transcrições na ordem original
+            return "\n".join(transcriptions)
     except Exception as e:
         st.error(f"Erro ao processar com Gemini: {str(e)}")
         return None
 
+@traced("transcribe_synthetic", _measure_text)
 def get_transcript_from_title_description(video_info, api_key):
     """Gera uma transcrição sintética de alta qualidade a partir do título e descrição do vídeo"""
     try:
         with st.spinner("Gerando transcrição sintética aprimorada..."):
             # Configurar a API
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-1.5-flash")
+            model = get_gemini_model(api_key, "gemini-1.5-flash")
             
             # Extrair informações do vídeo
             title = video_info.get('title', 'Título desconhecido')
@@ -610,8 +2091,7 @@ def get_transcript_from_title_description(video_info, api_key):
         st.error(f"Erro ao gerar transcrição sintética: {str(e)}")
         # Tentar uma abordagem mais simples em caso de erro
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-1.5-flash")
+            model = get_gemini_model(api_key, "gemini-1.5-flash")
             
             simple_prompt = f"""
             Crie uma transcrição detalhada para um vídeo do YouTube com o título "{video_info.get('title', '')}"
@@ -624,24 +2104,263 @@ def get_transcript_from_title_description(video_info, api_key):
         except:
             return f"Não foi possível gerar uma transcrição sintética. Informações disponíveis:\n\nTítulo: {video_info.get('title', '')}\n\nDescrição: {video_info.get('description', '')}"
 
-def get_youtube_transcript_with_fallback(video_id, openai_key=None):
-    """Tenta obter a transcrição do YouTube com múltiplos métodos"""
+# Métodos de transcrição, do mais confiável para o menos confiável
+TRANSCRIPT_METHODS = ["youtube_captions", "whisper", "vosk", "gemini_audio", "synthetic"]
+
+class TranscriptCache:
+    """Cache persistente de transcrições em SQLite, endereçado por conteúdo"""
+
+    def __init__(self, db_path, max_bytes=TRANSCRIPT_CACHE_MAX_BYTES, max_age=TRANSCRIPT_CACHE_MAX_AGE,
+                 synthetic_max_age=SYNTHETIC_TRANSCRIPT_CACHE_MAX_AGE):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.synthetic_max_age = min(synthetic_max_age, max_age)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            # O texto fica em uma tabela separada, indexada pelo hash do conteúdo,
+            # para que transcrições idênticas sejam armazenadas uma única vez
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_contents (
+                    content_hash TEXT PRIMARY KEY,
+                    transcript TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    video_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    is_synthetic INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, language, method)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_accessed ON transcripts (accessed_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # WAL permite leituras concorrentes de vários processos enquanto um escreve
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, video_id, language=None, method=None, include_synthetic=True):
+        """Retorna a melhor transcrição em cache para o vídeo (ou None)"""
+        try:
+            query = """
+                SELECT t.language, t.method, t.is_synthetic, t.created_at, c.transcript
+                FROM transcripts t JOIN transcript_contents c ON c.content_hash = t.content_hash
+                WHERE t.video_id = ? AND t.created_at >= CASE WHEN t.is_synthetic THEN ? ELSE ? END
+            """
+            now = time.time()
+            params = [video_id, now - self.synthetic_max_age, now - self.max_age]
+            if not include_synthetic:
+                query += " AND t.is_synthetic = 0"
+            if language:
+                query += " AND t.language = ?"
+                params.append(language)
+            if method:
+                query += " AND t.method = ?"
+                params.append(method)
+            
+            with self._connect() as conn:
+                rows = conn.execute(query, params).fetchall()
+                if not rows:
+                    return None
+                
+                # Preferir transcrições reais às sintéticas, na ordem dos métodos
+                rows.sort(key=lambda r: (TRANSCRIPT_METHODS.index(r[1]) if r[1] in TRANSCRIPT_METHODS else len(TRANSCRIPT_METHODS), -r[3]))
+                best = rows[0]
+                conn.execute(
+                    "UPDATE transcripts SET accessed_at = ? WHERE video_id = ? AND language = ? AND method = ?",
+                    (time.time(), video_id, best[0], best[1])
+                )
+            
+            return {
+                "transcript": best[4],
+                "language": best[0],
+                "method": best[1],
+                "is_synthetic": bool(best[2])
+            }
+        except sqlite3.Error:
+            return None
+
+    def put(self, video_id, language, method, transcript, is_synthetic=False):
+        """Armazena uma transcrição e aplica a política de expiração"""
+        if not transcript:
+            return
+        try:
+            data = transcript.encode("utf-8")
+            content_hash = hashlib.sha256(data).hexdigest()
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO transcript_contents (content_hash, transcript, size_bytes) VALUES (?, ?, ?)",
+                    (content_hash, transcript, len(data))
+                )
+                conn.execute(
+                    """INSERT OR REPLACE INTO transcripts
+                       (video_id, language, method, content_hash, is_synthetic, created_at, accessed_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (video_id, language or "auto", method, content_hash, int(is_synthetic), now, now)
+                )
+            self.evict()
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """Remove entradas expiradas e as menos acessadas até respeitar o limite de tamanho"""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM transcripts WHERE created_at < CASE WHEN is_synthetic THEN ? ELSE ? END",
+                    (time.time() - self.synthetic_max_age, time.time() - self.max_age)
+                )
+                
+                total = conn.execute("""
+                    SELECT COALESCE(SUM(c.size_bytes), 0)
+                    FROM transcripts t JOIN transcript_contents c ON c.content_hash = t.content_hash
+                """).fetchone()[0]
+                
+                if total > self.max_bytes:
+                    rows = conn.execute("""
+                        SELECT t.video_id, t.language, t.method, c.size_bytes
+                        FROM transcripts t JOIN transcript_contents c ON c.content_hash = t.content_hash
+                        ORDER BY t.accessed_at ASC
+                    """).fetchall()
+                    for video_id, language, method, size_bytes in rows:
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute(
+                            "DELETE FROM transcripts WHERE video_id = ? AND language = ? AND method = ?",
+                            (video_id, language, method)
+                        )
+                        total -= size_bytes
+                
+                # Remover conteúdos que não são mais referenciados
+                conn.execute("""
+                    DELETE FROM transcript_contents
+                    WHERE content_hash NOT IN (SELECT content_hash FROM transcripts)
+                """)
+        except sqlite3.Error:
+            pass
+
+@st.cache_resource
+def get_transcript_cache():
+    """Instância única do cache de transcrições, compartilhada entre as sessões"""
+    return TranscriptCache(os.path.join(CACHE_DIR, "transcripts.sqlite3"))
+
+def fetch_transcript_with_fallback(video_id, openai_key=None, gemini_key=None, interactive=True):
+    """Tenta obter a transcrição do YouTube com múltiplos métodos
+    
+    Retorna um dicionário com transcript, is_synthetic, method e language, ou None.
+    Com interactive=False nada é lido ou gravado na sessão do Streamlit (uso headless).
+    """
+    if gemini_key is None and interactive:
+        gemini_key = st.session_state.get('gemini_api_key')
+    
+    # Sessões que pedem o mesmo vídeo ao mesmo tempo compartilham uma única execução da cadeia.
+    # Os métodos alcançáveis dependem das chaves, então só chamadas com as mesmas chaves
+    # disponíveis se juntam (uma sem chaves não entrega seu resultado pior a quem as tem)
+    def fetch_automatic():
+        # O áudio baixado (ou reaproveitado) não pode ser despejado enquanto a cadeia o usa
+        with get_audio_store().lease(video_id, "mp3"):
+            return fetch_transcript_automatic(video_id, openai_key, gemini_key)
+    
+    with span("fetch_transcript") as transcript_span:
+        outcome = single_flight(
+            "transcript", video_id, fetch_automatic,
+            variant=(bool(openai_key), bool(gemini_key))
+        )
+        if outcome:
+            transcript_span.set(winner=outcome["method"], tokens=estimate_tokens(outcome["transcript"]))
+        else:
+            transcript_span.outcome = "empty"
+    
+    if outcome is None:
+        st.error("Não foi possível obter a transcrição automaticamente.")
+        if not interactive:
+            return None
+        outcome = request_manual_transcript()
+        if outcome is None:
+            return None
+    
+    if interactive:
+        st.session_state.transcript_method = outcome["method"]
+        if outcome["method"] not in ("youtube_captions", "video_info", "manual"):
+            # Salvar a transcrição na sessão
+            st.session_state.transcript = outcome["transcript"]
+    return dict(outcome)
+
+def request_manual_transcript():
+    """Método 4: Permitir entrada manual como último recurso"""
+    manual = {"method": "manual", "language": "auto", "is_synthetic": False}
+    
+    # Verificar se já temos uma transcrição na sessão
+    if st.session_state.transcript:
+        return {"transcript": st.session_state.transcript, **manual}
+    
+    manual_transcript = st.text_area(
+        "Como último recurso, você pode colar a transcrição manualmente:",
+        height=200,
+        placeholder="Cole aqui a transcrição do vídeo..."
+    )
+    
+    if manual_transcript:
+        st.session_state.transcript = manual_transcript
+        return {"transcript": manual_transcript, **manual}
+    
+    return None
+
+def fetch_transcript_automatic(video_id, openai_key=None, gemini_key=None):
+    """Percorre os métodos automáticos de transcrição, sem ler nem gravar a sessão
+    
+    Retorna o mesmo dicionário de fetch_transcript_with_fallback, ou None.
+    """
+    def result(transcript, method, language, is_synthetic=False, cache=True):
+        if cache:
+            get_transcript_cache().put(video_id, language, method, transcript, is_synthetic)
+        return {
+            "transcript": transcript,
+            "is_synthetic": is_synthetic,
+            "method": method,
+            "language": language
+        }
+    
+    # Método 0: Reutilizar uma transcrição real já obtida anteriormente (cache persistente).
+    # Sintéticas só são reaproveitadas no passo 3.4, depois de tentar os métodos reais
+    cached = get_transcript_cache().get(video_id, include_synthetic=False)
+    if cached:
+        st.success(f"✅ Transcrição recuperada do cache (método: {cached['method']})!")
+        return result(cached['transcript'], cached['method'], cached['language'], cached['is_synthetic'], cache=False)
+    
     # Método 1: Usando a biblioteca youtube-transcript-api diretamente
+    report_stage("transcript", "legendas do YouTube")
     try:
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['pt'])
-        transcript = ' '.join([item['text'] for item in transcript_list])
+        with span("transcribe_captions", language="pt"):
+            transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['pt'])
+        transcript = join_caption_lines([item['text'] for item in transcript_list])
         st.success("✅ Transcrição obtida com sucesso!")
-        return transcript, False  # False indica que não é sintética
+        return result(transcript, "youtube_captions", "pt")
     except Exception as e:
         st.warning(f"Método primário falhou: {str(e)}")
         
         # Método 2: Tentar com outras línguas
         try:
             st.info("Tentando obter legendas em outros idiomas...")
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
-            transcript = ' '.join([item['text'] for item in transcript_list])
+            with span("transcribe_captions", language="en"):
+                transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
+            transcript = join_caption_lines([item['text'] for item in transcript_list])
             st.success("✅ Transcrição obtida em inglês!")
-            return transcript, False
+            return result(transcript, "youtube_captions", "en")
         except:
             st.warning("Não foi possível obter legendas em outros idiomas.")
         
@@ -650,72 +2369,74 @@ def get_youtube_transcript_with_fallback(video_id, openai_key=None):
         video_info = get_video_info(video_id)
         
         if video_info:
+            # Reutilizar o áudio se ele já foi baixado por outra sessão ou processo
+            audio_file = get_audio_store().get(video_id, "mp3")
+            
             # Método 3.1: Usar Whisper para transcrever o áudio
             if openai_key:
                 st.info("Tentando transcrever o áudio do vídeo com Whisper...")
+                report_stage("transcript", "Whisper")
                 
                 # Baixar o áudio
                 audio_file = download_audio(video_id)
                 if audio_file:
                     # Transcrever o áudio com Whisper
-                    transcript = transcribe_with_whisper(audio_file, openai_key)
+                    transcript = single_flight("transcription/whisper", video_id, lambda: transcribe_with_whisper(audio_file, openai_key))
                     if transcript:
                         st.success("✅ Áudio transcrito com sucesso usando Whisper!")
-                        # Salvar a transcrição na sessão
-                        st.session_state.transcript = transcript
-                        return transcript, False
+                        return result(transcript, "whisper", "pt")
             
             # Método 3.2: Tentar com Vosk (offline)
             st.info("Tentando transcrever o áudio com Vosk (offline)...")
-            audio_file = download_audio(video_id) if 'audio_file' not in locals() else audio_file
-            if audio_file and VOSK_AVAILABLE:
-                transcript = transcribe_with_vosk(audio_file)
+            report_stage("transcript", "Vosk")
+            if VOSK_AVAILABLE:
+                if audio_file or not AUDIO_STREAMING:
+                    audio_file = audio_file or download_audio(video_id)
+                    transcript = single_flight("transcription/vosk", video_id, lambda: transcribe_with_vosk(audio_file)) if audio_file else None
+                else:
+                    # Sem áudio baixado ainda: decodificar direto da rede para o reconhecedor
+                    transcript = single_flight("transcription/vosk", video_id, lambda: transcribe_with_vosk_stream(video_id))
                 if transcript:
                     st.success("✅ Áudio transcrito com sucesso usando Vosk!")
-                    st.session_state.transcript = transcript
-                    return transcript, False
+                    return result(transcript, "vosk", "pt")
             
             # Método 3.3: Usar Gemini para processar o áudio
-            if 'gemini_api_key' in st.session_state and audio_file:
+            if gemini_key:
+                audio_file = audio_file or download_audio(video_id)
+            if gemini_key and audio_file:
                 st.info("Tentando processar o áudio com Gemini...")
-                transcript = transcribe_with_gemini(audio_file, st.session_state['gemini_api_key'])
+                report_stage("transcript", "áudio com Gemini")
+                transcript = single_flight("transcription/gemini_audio", video_id, lambda: transcribe_with_gemini(audio_file, gemini_key))
                 if transcript:
                     st.success("✅ Áudio processado com sucesso usando Gemini!")
-                    st.session_state.transcript = transcript
-                    return transcript, False
+                    return result(transcript, "gemini_audio", "pt")
             
             # Método 3.4: Gerar transcrição sintética a partir do título e descrição
-            if 'gemini_api_key' in st.session_state:
+            if gemini_key:
                 st.info("Gerando transcrição sintética aprimorada a partir das informações do vídeo...")
-                synthetic_transcript = get_transcript_from_title_description(video_info, st.session_state['gemini_api_key'])
+                report_stage("transcript", "transcrição sintética")
+                cached = get_transcript_cache().get(video_id, method="synthetic")
+                if cached:
+                    st.success("✅ Transcrição sintética recuperada do cache!")
+                    return result(cached['transcript'], "synthetic", cached['language'], is_synthetic=True, cache=False)
+                synthetic_transcript = get_transcript_from_title_description(video_info, gemini_key)
                 if synthetic_transcript:
                     st.success("✅ Transcrição sintética gerada com sucesso!")
-                    st.session_state.transcript = synthetic_transcript
-                    return synthetic_transcript, True  # True indica que é sintética
+                    return result(synthetic_transcript, "synthetic", "pt", is_synthetic=True)
             
             # Método 3.5: Usar informações do vídeo como fallback
             fallback_text = f"Título: {video_info['title']}\n\nDescrição: {video_info['description']}"
             st.warning("Usando informações básicas do vídeo em vez da transcrição completa.")
-            return fallback_text, False
-        
-        # Método 4: Permitir entrada manual como último recurso
-        st.error("Não foi possível obter a transcrição automaticamente.")
-        
-        # Verificar se já temos uma transcrição na sessão
-        if st.session_state.transcript:
-            return st.session_state.transcript, False
-        
-        manual_transcript = st.text_area(
-            "Como último recurso, você pode colar a transcrição manualmente:",
-            height=200,
-            placeholder="Cole aqui a transcrição do vídeo..."
-        )
-        
-        if manual_transcript:
-            st.session_state.transcript = manual_transcript
-            return manual_transcript, False
+            return result(fallback_text, "video_info", "auto", cache=False)
         
+        return None
+
+def get_youtube_transcript_with_fallback(video_id, openai_key=None):
+    """Tenta obter a transcrição do YouTube com múltiplos métodos (interface do Streamlit)"""
+    transcript_result = fetch_transcript_with_fallback(video_id, openai_key=openai_key)
+    if not transcript_result:
         return None, False
+    return transcript_result["transcript"], transcript_result["is_synthetic"]
 
 def display_transcript_preview(transcript, is_synthetic=False):
     """Exibe uma prévia da transcrição com formatação melhorada"""
@@ -754,57 +2475,262 @@ def display_transcript_preview(transcript, is_synthetic=False):
         
         return transcript
 
-def fix_json_string(json_str):
-    """Corrige problemas comuns em strings JSON"""
-    # Remover vírgulas extras antes de fechamento de arrays
-    json_str = re.sub(r',\s*\]', ']', json_str)
-    # Remover vírgulas extras antes de fechamento de objetos
-    json_str = re.sub(r',\s*\}', '}', json_str)
-    # Adicionar vírgulas faltantes entre objetos
-    json_str = re.sub(r'\}\s*\{', '},{', json_str)
-    return json_str
-
-def safe_json_parse(json_str):
-    """Tenta analisar JSON com várias estratégias de fallback"""
-    try:
-        # Primeira tentativa: direta
-        return json.loads(json_str)
-    except json.JSONDecodeError:
-        try:
-            # Segunda tentativa: corrigir problemas comuns
-            fixed_json = fix_json_string(json_str)
-            return json.loads(fixed_json)
-        except json.JSONDecodeError:
-            try:
-                # Terceira tentativa: extrair apenas a parte entre colchetes
-                start_idx = json_str.find('[')
-                end_idx = json_str.rfind(']') + 1
-                if start_idx != -1 and end_idx > start_idx:
-                    json_part = json_str[start_idx:end_idx]
-                    fixed_json = fix_json_string(json_part)
-                    return json.loads(fixed_json)
-            except:
-                pass
+class JSONObjectScanner:
+    """Extrai objetos JSON de nível superior em uma única passada linear, tolerando ruído
+    
+    Texto fora dos objetos (cercas de código, comentários do modelo, colchetes) é ignorado,
+    vírgulas sobrando antes de '}' ou ']' são removidas durante a leitura e o texto pode
+    chegar aos pedaços (feed), o que permite o uso com respostas em streaming.
+    Um objeto que não fecha antes do início da próxima pergunta ({"pergunta": ...) é
+    descartado e a leitura recomeça nela, para que uma aspa sem escape ou uma '}' ausente
+    não engula as perguntas seguintes.
+    """
+
+    # Strings completas são consumidas de uma vez; '"' sozinha indica uma string ainda incompleta
+    # e uma vírgula no fim do texto só pode ser avaliada quando o próximo pedaço chegar
+    _TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|"|[{}]|,(?=\s*[}\]])|,\s*\Z')
+    _QUESTION_START = re.compile(r'\{\s*"pergunta"\s*:')
+    _DECODER = json.JSONDecoder()
+    _FAST_PATH_WINDOW = 8192
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._cuts = []
+
+    def feed(self, text):
+        """Processa mais um pedaço do texto e retorna os objetos completados nele
+        
+        Cada item é uma tupla (valor, texto bruto, erro); valor é None quando o objeto não pôde ser lido.
+        """
+        completed = []
+        buffer = self._buffer + text
+        pos = self._pos
+        start = 0
+        resync = None
+        while True:
+            if self._depth == 0:
+                # Fora de um objeto: ignorar colchetes, vírgulas e texto ao redor
+                start = buffer.find("{", pos)
+                if start == -1:
+                    pos = start = len(buffer)
+                    break
+                
+                # Caminho rápido: objetos bem formados são lidos direto pelo decodificador em C.
+                # A janela limita o custo das falhas (o erro conta as linhas até a posição)
+                window = buffer[start:start + self._FAST_PATH_WINDOW]
+                try:
+                    value, end = self._DECODER.raw_decode(window)
+                    completed.append((value, window[:end], None))
+                    pos = start + end
+                    continue
+                except json.JSONDecodeError:
+                    pass
+                
+                # Objeto com defeito ou ainda incompleto: percorrer token a token
+                self._depth = 1
+                self._cuts = []
+                pos = start + 1
+                resync = None
+                continue
             
-            # Quarta tentativa: usar regex para extrair objetos JSON individuais
-            try:
-                pattern = r'\{\s*"pergunta"\s*:\s*"[^"]*"\s*,\s*"resposta"\s*:\s*"[^"]*"\s*\}'
-                matches = re.findall(pattern, json_str)
-                if matches:
-                    combined = "[" + ",".join(matches) + "]"
-                    return json.loads(combined)
-            except:
-                pass
+            if resync is None:
+                # Início da próxima pergunta, se já chegou (len(buffer) quando não há)
+                found = self._QUESTION_START.search(buffer, start + 1)
+                resync = found.start() if found else len(buffer)
+            
+            match = self._TOKEN.search(buffer, pos)
+            if not match:
+                pos = len(buffer)
+                break
+            
+            token = match.group()
+            if match.end() > resync or (token == '"' and resync < len(buffer)):
+                # O objeto atual invadiu a próxima pergunta: descartá-lo e recomeçar a leitura nela
+                # (um envelope como {"perguntas": [ é apenas pulado, não conta como descartado)
+                if self._QUESTION_START.match(buffer, start):
+                    completed.append((None, buffer[start:resync], "objeto malformado"))
+                self._depth = 0
+                self._cuts = []
+                pos = resync
+                continue
+            
+            if token == '"' or (token[0] == "," and match.end() == len(buffer)):
+                # Aguardar o próximo pedaço para decidir
+                pos = match.start()
+                break
+            
+            pos = match.end()
+            if token == "{":
+                self._depth += 1
+            elif token == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = self._join_without_cuts(buffer, start, pos)
+                    try:
+                        completed.append((json.loads(raw), raw, None))
+                    except json.JSONDecodeError as e:
+                        completed.append((None, raw, str(e)))
+            elif token[0] == ",":
+                # Vírgula sobrando antes de um fechamento
+                self._cuts.append(match.start())
+        
+        # Guardar apenas o objeto em andamento para o próximo pedaço
+        self._buffer = buffer[start:] if self._depth else ""
+        self._pos = pos - start if self._depth else 0
+        self._cuts = [cut - start for cut in self._cuts] if self._depth else []
+        return completed
+
+    def _join_without_cuts(self, buffer, start, end):
+        if not self._cuts:
+            return buffer[start:end]
+        pieces = []
+        previous = start
+        for cut in self._cuts:
+            pieces.append(buffer[previous:cut])
+            previous = cut + 1
+        pieces.append(buffer[previous:end])
+        return "".join(pieces)
+
+    def close(self):
+        """Finaliza a leitura e retorna o objeto incompleto que sobrou, se houver"""
+        raw = self._buffer
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._cuts = []
+        if not raw:
+            return []
+        return [(None, raw, "objeto incompleto")]
+
+def validate_question(question, question_type=None):
+    """Verifica se o objeto segue o formato do tipo de pergunta; retorna o motivo da falha ou None"""
+    if not isinstance(question, dict):
+        return "não é um objeto"
+    if not isinstance(question.get("pergunta"), str) or not question["pergunta"].strip():
+        return "campo 'pergunta' ausente ou vazio"
+    
+    if question_type == "multipla_escolha":
+        opcoes = question.get("opcoes")
+        if not isinstance(opcoes, dict) or len(opcoes) < 2:
+            return "campo 'opcoes' ausente ou com menos de duas opções"
+        if not all(isinstance(v, str) for v in opcoes.values()):
+            return "opções devem ser textos"
+        resposta_correta = question.get("resposta_correta")
+        if not isinstance(resposta_correta, str) or resposta_correta not in opcoes:
+            return "'resposta_correta' não corresponde a nenhuma opção"
+        if not isinstance(question.get("explicacao"), str):
+            return "campo 'explicacao' ausente"
+    elif question_type == "dissertativa":
+        if not isinstance(question.get("resposta"), str) or not question["resposta"].strip():
+            return "campo 'resposta' ausente ou vazio"
     
     return None
 
-def generate_questions(transcript, api_key, num_questions=5, question_type="dissertativa"):
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
+def collect_questions(scanned, question_type, questions, dropped):
+    """Valida os objetos lidos pelo scanner, separando perguntas válidas das descartadas"""
+    for value, raw, error in scanned:
+        if error is None:
+            # Aceitar respostas embrulhadas, como {"perguntas": [...]}
+            if isinstance(value, dict) and "pergunta" not in value:
+                nested = [v for v in value.values() if isinstance(v, list) and v and all(isinstance(i, dict) for i in v)]
+                if len(nested) == 1:
+                    collect_questions([(item, json.dumps(item, ensure_ascii=False), None) for item in nested[0]],
+                                      question_type, questions, dropped)
+                    continue
+            error = validate_question(value, question_type)
         
-        if question_type == "multipla_escolha":
-            prompt = f"""
+        if error is None:
+            questions.append(value)
+        else:
+            dropped.append({"motivo": error, "trecho": raw[:200]})
+
+@traced("parse_questions", _measure_parse)
+def parse_questions(text, question_type=None):
+    """Extrai e valida as perguntas da resposta do modelo em uma única passada
+    
+    Retorna (perguntas válidas, descartadas), onde cada descartada traz o motivo e um trecho do objeto.
+    """
+    scanner = JSONObjectScanner()
+    questions = []
+    dropped = []
+    collect_questions(scanner.feed(text), question_type, questions, dropped)
+    collect_questions(scanner.close(), question_type, questions, dropped)
+    return questions, dropped
+
+def safe_json_parse(json_str, question_type=None):
+    """Analisa a resposta do modelo de forma tolerante, retornando a lista de perguntas ou None"""
+    questions, _ = parse_questions(json_str, question_type)
+    return questions or None
+
+class QuestionCache:
+    """Memoização em memória das perguntas geradas, com despejo LRU e expiração por TTL"""
+
+    def __init__(self, maxsize=QUESTION_CACHE_MAX_ENTRIES, ttl=QUESTION_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(transcript, num_questions, question_type, model_name=QUESTION_MODEL, prompt_version=QUESTION_PROMPT_VERSION, variant="single"):
+        """Gera a chave a partir do hash da transcrição e dos parâmetros de geração"""
+        transcript_hash = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+        payload = json.dumps([transcript_hash, num_questions, question_type, model_name, prompt_version, variant])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            questions = self._cache.get(key)
+            if questions is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Devolver uma cópia para que alterações na sessão não afetem o cache
+            return copy.deepcopy(questions)
+
+    def set(self, key, questions):
+        with self._lock:
+            self._cache[key] = copy.deepcopy(questions)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+@st.cache_resource
+def get_question_cache():
+    """Instância única do cache de perguntas, compartilhada entre as sessões"""
+    return QuestionCache()
+
+def build_questions_prompt(transcript, num_questions, question_type, avoid=None, focus=None):
+    """Monta o prompt de geração de perguntas para o tipo escolhido
+    
+    avoid lista perguntas já aceitas, que o modelo não deve repetir; focus direciona
+    as perguntas para um subtópico (modo banco de questões).
+    """
+    prompt = _base_questions_prompt(transcript, num_questions, question_type)
+    if focus:
+        prompt += f"""
+            Concentre as perguntas no subtópico "{focus}", sem fugir do conteúdo da transcrição.
+            """
+    if avoid:
+        existing = "\n".join(f"- {question}" for question in avoid)
+        prompt += f"""
+            Não repita nenhuma destas perguntas, que já foram geradas:
+            {existing}
+            """
+    return prompt
+
+def _base_questions_prompt(transcript, num_questions, question_type):
+    if question_type == "multipla_escolha":
+        return f"""
             Com base na seguinte transcrição, gere {num_questions} perguntas de múltipla escolha que testem a compreensão dos conceitos-chave:
             
             Transcrição:
@@ -833,8 +2759,8 @@ def generate_questions(transcript, api_key, num_questions=5, question_type="diss
             4. As perguntas sejam relevantes para o conteúdo da transcrição
             5. O JSON seja válido e não tenha vírgulas extras ou faltantes
             """
-        else:
-            prompt = f"""
+    
+    return f"""
             Com base na seguinte transcrição, gere {num_questions} perguntas dissertativas que testem a compreensão dos conceitos-chave:
             
             Transcrição:
@@ -851,39 +2777,942 @@ def generate_questions(transcript, api_key, num_questions=5, question_type="diss
             2. As respostas sejam detalhadas e educativas
             3. O JSON seja válido e não tenha vírgulas extras ou faltantes
             """
-        
-        response = model.generate_content(prompt)
-        
-        # Extrair o JSON da resposta
-        questions_json = response.text
-        
-        # Exibir o JSON bruto para debug (opcional)
-        with st.expander("Ver resposta bruta (para debug)"):
-            st.code(questions_json)
-        
-        # Tentar analisar o JSON com tratamento de erros aprimorado
-        questions = safe_json_parse(questions_json)
-        
-        if questions:
-            return questions
-        else:
-            st.error("Erro ao analisar o JSON das perguntas.")
-            return []
-    except Exception as e:
-        st.error(f"Erro ao gerar perguntas: {str(e)}")
-        return []
 
-def check_answer(question_idx, selected_option):
-    """Verifica se a resposta selecionada está correta e atualiza o estado"""
-    question = st.session_state.questions[question_idx]
-    st.session_state[f"resposta_selecionada_{question_idx}"] = selected_option
-    st.session_state[f"mostrar_resultado_{question_idx}"] = True
+def estimate_tokens(text):
+    """Estimativa rápida do número de tokens (~4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+def split_transcript_windows(transcript, max_tokens=LONG_TRANSCRIPT_WINDOW_TOKENS):
+    """Divide a transcrição em janelas consecutivas de até max_tokens, cortando entre frases"""
+    # Quebrar em linhas (transcrições com marcações de tempo) e depois em frases
+    sentences = [s for s in re.split(r'(?<=[.!?])\s+|\n+', transcript) if s.strip()]
+    
+    windows = []
+    current = []
+    current_tokens = 0
+    for sentence in sentences:
+        sentence_tokens = estimate_tokens(sentence)
+        if current and current_tokens + sentence_tokens > max_tokens:
+            windows.append(" ".join(current))
+            current = []
+            current_tokens = 0
+        current.append(sentence)
+        current_tokens += sentence_tokens
+    if current:
+        windows.append(" ".join(current))
+    return windows
+
+# Marcações de trechos sem fala nas legendas automáticas ([Música], [Aplausos], ♪...)
+NON_SPEECH_PATTERN = re.compile(
+    r"[\[(](?:m[úu]sica|music|aplausos|applause|risos|laughter|sil[êe]ncio|silence|"
+    r"inaud[íi]vel|inaudible|barulho|ru[íi]do|noise)[\])]|[♪♫]+",
+    re.IGNORECASE
+)
+# Hesitações sem conteúdo ("ahn", "hum", "uh"...); "um" não entra por ser artigo em português
+FILLER_PATTERN = re.compile(r"(?<!\w)(?:ahn+|h[ãa]+|ãh+|hum+|hmm+|uhm+|uh+|éé+|erm+)(?!\w),?", re.IGNORECASE)
+LINE_TIMESTAMP_PATTERN = re.compile(r"^\[\d{2}:\d{2}\]\s*")
+
+def join_caption_lines(lines):
+    """Junta as linhas de legenda descartando o texto repetido entre linhas consecutivas
+    
+    As legendas automáticas repetem o final de uma linha no início da seguinte.
+    """
+    words = []
+    for line in lines:
+        text = " ".join(line.split())
+        if words and text:
+            text = dedupe_seam(" ".join(words[-30:]), text)
+        words.extend(text.split())
+    return " ".join(words)
+
+PORTUGUESE_STOP_WORDS = frozenset("""
+a à ao aos as às até com como da das de dela dele deles depois do dos e é ela elas ele eles em entre
+era essa essas esse esses esta está estão estas este estes eu foi for foram há isso isto já lhe mais
+mas me mesmo meu minha muito na nas não nem no nos nós nossa nosso num numa o os ou para pela pelas
+pelo pelos por qual quando que quem se sem ser seu sua são só também te tem tu tua um uma umas uns
+você vocês vai vamos aqui aí então assim tipo né gente coisa ter tá pra pro
+""".split())
+
+SALIENCE_LANGUAGES = ("pt", "en")
+
+def salience_stop_words(language):
+    """Palavras comuns ignoradas na pontuação TF-IDF (as do inglês vêm do scikit-learn)"""
+    if language == "en":
+        return get_provider_registry().load("sklearn").ENGLISH_STOP_WORDS
+    return PORTUGUESE_STOP_WORDS
+
+def detect_language(text, sample_words=2000):
+    """Identifica se o texto está em português ou inglês pela frequência de palavras comuns"""
+    words = [_normalize_word(w) for w in text.split()[:sample_words]]
+    pt_hits = sum(1 for w in words if w in PORTUGUESE_STOP_WORDS)
+    english_stop_words = salience_stop_words("en")
+    en_hits = sum(1 for w in words if w in english_stop_words)
+    return "en" if en_hits > pt_hits else "pt"
+
+def split_passages(transcript, max_words=SALIENCE_PASSAGE_WORDS):
+    """Divide a transcrição em trechos curtos (frases ou blocos de até max_words palavras)
+    
+    Legendas automáticas não têm pontuação, então frases longas demais são quebradas por tamanho.
+    """
+    passages = []
+    for sentence in re.split(r'(?<=[.!?])\s+|\n+', transcript):
+        words = sentence.split()
+        for start in range(0, len(words), max_words):
+            passages.append(" ".join(words[start:start + max_words]))
+    return passages
+
+def score_passages(passages, language=None, method="tfidf"):
+    """Atribui uma nota de relevância a cada trecho
+    
+    "tfidf" mede a similaridade de cada trecho com o centróide TF-IDF da transcrição;
+    "textrank" aplica PageRank sobre o grafo de similaridade entre os trechos.
+    Retorna um array NumPy com uma nota por trecho.
+    """
+    if not passages:
+        return np.zeros(0)
+    if language not in SALIENCE_LANGUAGES:
+        language = detect_language(" ".join(passages))
+    
+    vectorizer = TfidfVectorizer(
+        stop_words=list(salience_stop_words(language)),
+        sublinear_tf=True,
+        token_pattern=r"(?u)\b\w\w+\b"
+    )
+    try:
+        matrix = vectorizer.fit_transform(passages)
+    except ValueError:
+        # Nenhum termo além das palavras comuns
+        return np.zeros(len(passages))
+    
+    if method == "textrank":
+        similarity = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(similarity, 0.0)
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        transition = np.divide(similarity, row_sums, out=np.zeros_like(similarity), where=row_sums > 0)
+        n = len(passages)
+        scores = np.full(n, 1.0 / n)
+        for _ in range(50):
+            updated = 0.15 / n + 0.85 * (transition.T @ scores)
+            if np.abs(updated - scores).sum() < 1e-6:
+                scores = updated
+                break
+            scores = updated
+        return scores
+    
+    centroid = np.asarray(matrix.mean(axis=0)).ravel()
+    return matrix @ centroid
+
+def select_salient_passages(transcript, token_budget, language=None, method=None):
+    """Mantém os trechos mais relevantes que cabem no orçamento, na ordem original
+    
+    Trechos não consecutivos são separados por quebra de linha.
+    """
+    passages = split_passages(transcript)
+    scores = score_passages(passages, language, method or SALIENCE_METHOD)
+    tokens = np.fromiter((estimate_tokens(p) for p in passages), dtype=np.int64, count=len(passages))
+    
+    # Ordem decrescente de relevância (estável, para empates favorecerem o início do vídeo)
+    order = np.argsort(-scores, kind="stable")
+    fits = np.cumsum(tokens[order]) <= token_budget
+    keep = np.sort(order[fits])
+    
+    pieces = []
+    previous = None
+    for index in keep:
+        if previous is not None:
+            pieces.append(" " if index == previous + 1 else "\n")
+        pieces.append(passages[index])
+        previous = index
+    return "".join(pieces)
+
+def enforce_token_budget(transcript, token_budget, language=None):
+    """Limita a transcrição a token_budget tokens estimados
+    
+    Por padrão mantém os trechos mais relevantes (SALIENCE_METHOD); com "truncate" corta o final.
+    """
+    if estimate_tokens(transcript) <= token_budget:
+        return transcript
+    if SALIENCE_METHOD != "truncate":
+        selected = select_salient_passages(transcript, token_budget, language)
+        if selected:
+            return selected
+    kept = split_transcript_windows(transcript, token_budget)[0]
+    # Uma única frase maior que o orçamento é cortada no limite de caracteres
+    return kept[:token_budget * 4]
+
+def compress_transcript(transcript, token_budget=None, language=None):
+    """Reduz os tokens da transcrição antes de enviá-la ao modelo
+    
+    Remove marcações sem fala e hesitações, descarta frases repetidas (comuns nas
+    transcrições sintéticas) e aplica o orçamento de tokens, quando houver.
+    Retorna (transcrição, relatório com os tokens estimados antes e depois).
+    """
+    if token_budget is None:
+        token_budget = TRANSCRIPT_TOKEN_BUDGET
+    tokens_before = estimate_tokens(transcript)
+    
+    text, markers_removed = NON_SPEECH_PATTERN.subn(" ", transcript)
+    text, fillers_removed = FILLER_PATTERN.subn(" ", text)
+    
+    seen = set()
+    duplicates_removed = 0
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        timestamp = LINE_TIMESTAMP_PATTERN.match(line)
+        prefix = timestamp.group(0).strip() if timestamp else ""
+        kept = []
+        for sentence in re.split(r'(?<=[.!?])\s+', line[len(timestamp.group(0)):] if timestamp else line):
+            sentence = " ".join(sentence.split())
+            key = " ".join(_normalize_word(w) for w in sentence.split())
+            if not key.strip():
+                continue
+            # Frases curtas ("Sim.", "Certo.") podem se repetir legitimamente
+            if len(key.split()) >= 4:
+                if key in seen:
+                    duplicates_removed += 1
+                    continue
+                seen.add(key)
+            kept.append(sentence)
+        if kept:
+            lines.append(" ".join([prefix] + kept if prefix else kept))
+    text = "\n".join(lines)
+    
+    truncated = False
+    if token_budget and estimate_tokens(text) > token_budget:
+        text = enforce_token_budget(text, token_budget, language)
+        truncated = True
+    
+    return text, {
+        "tokens_before": tokens_before,
+        "tokens_after": estimate_tokens(text),
+        "markers_removed": markers_removed,
+        "fillers_removed": fillers_removed,
+        "duplicates_removed": duplicates_removed,
+        "token_budget": token_budget or None,
+        "truncated": truncated
+    }
+
+# Esquemas de resposta declarados ao Gemini no modo de saída estruturada
+QUESTION_RESPONSE_SCHEMAS = {
+    "dissertativa": {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "pergunta": {"type": "STRING"},
+                "resposta": {"type": "STRING"}
+            },
+            "required": ["pergunta", "resposta"]
+        }
+    },
+    "multipla_escolha": {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "pergunta": {"type": "STRING"},
+                "opcoes": {
+                    "type": "OBJECT",
+                    "properties": {letter: {"type": "STRING"} for letter in "abcde"},
+                    "required": list("abcde")
+                },
+                "resposta_correta": {"type": "STRING", "enum": list("abcde")},
+                "explicacao": {"type": "STRING"}
+            },
+            "required": ["pergunta", "opcoes", "resposta_correta", "explicacao"]
+        }
+    }
+}
+
+def questions_generation_config(question_type, schema_mode):
+    """Configuração de geração: JSON com esquema declarado quando schema_mode está ativo"""
+    if not schema_mode:
+        return None
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": QUESTION_RESPONSE_SCHEMAS[question_type]
+    }
+
+def request_questions(model, transcript, num_questions, question_type, schema_mode=False, avoid=None, focus=None):
+    """Faz uma chamada ao modelo, sem usar a interface
+    
+    Retorna (perguntas válidas, descartadas, resposta bruta).
+    """
+    prompt = build_questions_prompt(transcript, num_questions, question_type, avoid=avoid, focus=focus)
+    with span("generate_questions.llm", tokens=estimate_tokens(prompt), schema_mode=schema_mode) as llm_span:
+        response = model.generate_content(
+            prompt,
+            generation_config=questions_generation_config(question_type, schema_mode)
+        )
+        questions_json = response.text
+        llm_span.set(output_tokens=estimate_tokens(questions_json))
+    questions, dropped = parse_questions(questions_json, question_type)
+    return questions, dropped, questions_json
+
+def request_questions_with_repair(model, transcript, num_questions, question_type, schema_mode=False, focus=None):
+    """Gera as perguntas e pede de novo apenas a quantidade que faltou por itens inválidos
+    
+    Retorna (perguntas válidas, todas as descartadas, respostas brutas concatenadas).
+    """
+    questions, dropped, questions_json = request_questions(
+        model, transcript, num_questions, question_type, schema_mode, focus=focus
+    )
+    raw_responses = [questions_json]
+    
+    for _ in range(QUESTION_REPAIR_ATTEMPTS):
+        missing = num_questions - len(questions)
+        if not dropped or missing <= 0:
+            break
+        extra, extra_dropped, extra_json = request_questions(
+            model, transcript, missing, question_type, schema_mode,
+            avoid=[q["pergunta"] for q in questions], focus=focus
+        )
+        questions.extend(extra[:missing])
+        dropped.extend(extra_dropped)
+        raw_responses.append(extra_json)
+    
+    return questions[:num_questions], dropped, "\n\n".join(raw_responses)
+
+def question_cache_key(transcript, num_questions, question_type, long_mode=False, schema_mode=False):
+    """Chave do cache de perguntas, distinguindo os modos de geração"""
+    variant = ("map_reduce" if long_mode else "single") + ("+schema" if schema_mode else "")
+    return QuestionCache.make_key(transcript, num_questions, question_type, variant=variant)
+
+def balance_questions(candidates_per_window, num_questions):
+    """Etapa de redução: escolhe as perguntas alternando entre as janelas para cobrir todo o vídeo"""
+    selected = []
+    seen = set()
+    max_candidates = max((len(c) for c in candidates_per_window), default=0)
+    for rank in range(max_candidates):
+        for candidates in candidates_per_window:
+            if len(selected) >= num_questions:
+                return selected
+            if rank >= len(candidates):
+                continue
+            question = candidates[rank]
+            key = _normalize_word(str(question.get("pergunta", "")))
+            if key in seen:
+                continue
+            seen.add(key)
+            selected.append(question)
+    return selected
+
+def spread_window_order(num_windows, num_questions):
+    """Ordem de uso das janelas: primeiro num_questions janelas espaçadas ao longo do vídeo, depois as demais
+    
+    Com mais janelas que perguntas, pedir perguntas a todas gastaria tokens em janelas que o
+    reduce descartaria; as espaçadas garantem que o fim do vídeo também seja coberto.
+    """
+    picks = min(num_windows, max(1, num_questions))
+    spread = sorted({int((i + 0.5) * num_windows / picks) for i in range(picks)})
+    return spread + [i for i in range(num_windows) if i not in set(spread)]
+
+def generate_questions_map_reduce(transcript, model, num_questions, question_type, schema_mode=False):
+    """Gera perguntas por janela em paralelo (map) e equilibra o resultado final (reduce)"""
+    windows = split_transcript_windows(transcript)
+    order = spread_window_order(len(windows), num_questions)
+    if len(windows) > num_questions:
+        # Uma pergunta por janela espaçada; falhas e repetições são cobertas pelas janelas restantes
+        per_window = 1
+    else:
+        # Pedir um pouco mais que a cota de cada janela para compensar repetições e falhas
+        per_window = min(num_questions, math.ceil(num_questions / len(windows)) + 1)
+    
+    candidates = [[] for _ in windows]
+    used = 0
+    selected = []
+    with ThreadPoolExecutor(max_workers=min(LONG_TRANSCRIPT_WORKERS, len(windows))) as executor:
+        # Janelas espaçadas primeiro; as seguintes só entram para cobrir falhas ou perguntas repetidas
+        while used < len(order) and len(selected) < num_questions:
+            batch = order[used:used + max(1, num_questions - len(selected))] if used else order[:num_questions]
+            used += len(batch)
+            futures = {
+                submit_in_context(executor, request_questions_with_repair, model, windows[i], per_window, question_type, schema_mode): i
+                for i in batch
+            }
+            for future in as_completed(futures):
+                try:
+                    candidates[futures[future]] = future.result()[0]
+                except Exception:
+                    # Uma janela com falha não invalida as demais
+                    continue
+            selected = balance_questions([candidates[i] for i in order[:used]], num_questions)
+    
+    # Apresentar as perguntas na ordem do vídeo
+    position = {id(question): i for i, window_candidates in enumerate(candidates) for question in window_candidates}
+    selected.sort(key=lambda question: position[id(question)])
+    return selected, used
+
+@traced("generate_questions", _measure_questions)
+def generate_questions(transcript, api_key, num_questions=5, question_type="dissertativa", force_regenerate=False, long_mode=None, schema_mode=None):
+    """Gera perguntas a partir da transcrição
+    
+    Transcrições acima de LONG_TRANSCRIPT_TOKENS (ou com long_mode=True) usam o modo map-reduce.
+    Com schema_mode a resposta é pedida como JSON com esquema declarado.
+    """
+    if long_mode is None:
+        long_mode = estimate_tokens(transcript) > LONG_TRANSCRIPT_TOKENS
+    if schema_mode is None:
+        schema_mode = QUESTION_SCHEMA_MODE
+    
+    # Reutilizar o resultado de uma geração idêntica, a menos que o usuário force uma nova
+    cache = get_question_cache()
+    cache_key = question_cache_key(transcript, num_questions, question_type, long_mode, schema_mode)
+    if not force_regenerate:
+        cached_questions = cache.get(cache_key)
+        if cached_questions:
+            st.info("♻️ Perguntas recuperadas do cache (nenhuma chamada à IA foi necessária).")
+            return cached_questions
+    
+    try:
+        model = get_gemini_model(api_key)
+        
+        if long_mode:
+            questions, num_windows = generate_questions_map_reduce(transcript, model, num_questions, question_type, schema_mode)
+            st.info(f"Transcrição longa: perguntas geradas em paralelo a partir de {num_windows} trechos do vídeo.")
+        else:
+            questions, dropped, questions_json = request_questions_with_repair(
+                model, transcript, num_questions, question_type, schema_mode
+            )
+            
+            if dropped:
+                st.warning(f"⚠️ {len(dropped)} pergunta(s) com formato inválido foram descartadas e pedidas novamente.")
+            
+            # Exibir o JSON bruto para debug (opcional)
+            with st.expander("Ver resposta bruta (para debug)"):
+                st.code(questions_json)
+                if dropped:
+                    st.json(dropped)
+        
+        if questions:
+            cache.set(cache_key, questions)
+            return questions
+        else:
+            st.error("Erro ao analisar o JSON das perguntas.")
+            return []
+    except Exception as e:
+        st.error(f"Erro ao gerar perguntas: {str(e)}")
+        return []
+
+def chunk_text(chunk):
+    """Texto de um trecho do streaming do Gemini, ou "" se ele não tiver texto
+
+    chunk.text levanta ValueError quando o trecho não tem partes de texto, como num
+    bloqueio de segurança ou no trecho final que só traz o finish_reason.
+    """
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+def generate_questions_stream(transcript, api_key, num_questions=5, question_type="dissertativa", force_regenerate=False, schema_mode=None):
+    """Gera perguntas em modo streaming, produzindo cada pergunta assim que ela fica completa"""
+    if schema_mode is None:
+        schema_mode = QUESTION_SCHEMA_MODE
+    
+    cache = get_question_cache()
+    cache_key = question_cache_key(transcript, num_questions, question_type, schema_mode=schema_mode)
+    if not force_regenerate:
+        cached_questions = cache.get(cache_key)
+        if cached_questions:
+            st.info("♻️ Perguntas recuperadas do cache (nenhuma chamada à IA foi necessária).")
+            yield from cached_questions
+            return
+    
+    try:
+        model = get_gemini_model(api_key)
+        response = model.generate_content(
+            build_questions_prompt(transcript, num_questions, question_type),
+            generation_config=questions_generation_config(question_type, schema_mode),
+            stream=True
+        )
+        
+        scanner = JSONObjectScanner()
+        questions = []
+        dropped = []
+        with span("generate_questions.llm", tokens=estimate_tokens(transcript), schema_mode=schema_mode, streaming=True) as llm_span:
+            output_chars = 0
+            for chunk in response:
+                text = chunk_text(chunk)
+                if not text:
+                    continue
+                output_chars += len(text)
+                new_questions = []
+                collect_questions(scanner.feed(text), question_type, new_questions, dropped)
+                for question in new_questions:
+                    questions.append(question)
+                    yield question
+            collect_questions(scanner.close(), question_type, [], dropped)
+            llm_span.set(output_tokens=output_chars // 4 + 1, items=len(questions), dropped=len(dropped))
+        
+        # Pedir de novo apenas as perguntas que faltaram, nunca o lote inteiro
+        for _ in range(QUESTION_REPAIR_ATTEMPTS):
+            missing = num_questions - len(questions)
+            if not dropped or missing <= 0:
+                break
+            extra, extra_dropped, _raw = request_questions(
+                model, transcript, missing, question_type, schema_mode,
+                avoid=[q["pergunta"] for q in questions]
+            )
+            for question in extra[:missing]:
+                questions.append(question)
+                yield question
+            dropped.extend(extra_dropped)
+        
+        if dropped:
+            st.warning(f"⚠️ {len(dropped)} pergunta(s) com formato inválido foram descartadas.")
+        
+        if questions:
+            cache.set(cache_key, questions)
+        else:
+            st.error("Erro ao analisar o JSON das perguntas.")
+    except Exception as e:
+        st.error(f"Erro ao gerar perguntas: {str(e)}")
+
+def extract_subtopics(transcript, count, language=None):
+    """Lista os termos de maior peso TF-IDF da transcrição, usados como subtópicos dos lotes"""
+    passages = split_passages(transcript)
+    if language not in SALIENCE_LANGUAGES:
+        language = detect_language(transcript)
+    vectorizer = TfidfVectorizer(
+        stop_words=list(salience_stop_words(language)),
+        sublinear_tf=True,
+        token_pattern=r"(?u)\b\w{4,}\b"
+    )
+    try:
+        matrix = vectorizer.fit_transform(passages)
+    except ValueError:
+        return []
+    weights = np.asarray(matrix.sum(axis=0)).ravel()
+    terms = vectorizer.get_feature_names_out()
+    return [terms[i] for i in np.argsort(-weights, kind="stable")[:count]]
+
+def remove_near_duplicates(questions, threshold=BANK_DUPLICATE_THRESHOLD):
+    """Remove perguntas quase repetidas pela similaridade de cosseno TF-IDF
+    
+    A similaridade de todos os pares é calculada de uma vez (produto de matrizes);
+    uma pergunta é descartada quando se parece demais com alguma anterior.
+    Retorna (perguntas mantidas, quantidade removida).
+    """
+    if len(questions) < 2:
+        return list(questions), 0
+    vectorizer = TfidfVectorizer(sublinear_tf=True, strip_accents="unicode")
+    try:
+        matrix = vectorizer.fit_transform([q["pergunta"] for q in questions])
+    except ValueError:
+        return list(questions), 0
+    
+    similarity = (matrix @ matrix.T).toarray()
+    duplicate = np.triu(similarity >= threshold, k=1).any(axis=0)
+    kept = [q for q, is_duplicate in zip(questions, duplicate) if not is_duplicate]
+    return kept, int(duplicate.sum())
+
+def generate_question_bank(transcript, api_key, num_questions=200, question_type="dissertativa", schema_mode=None, on_progress=None):
+    """Gera um banco grande de perguntas em lotes paralelos, sem usar a interface
+    
+    Cada lote combina uma janela da transcrição com um subtópico diferente; no fim as
+    perguntas quase repetidas são removidas. Retorna (perguntas, relatório).
+    """
+    if schema_mode is None:
+        schema_mode = QUESTION_SCHEMA_MODE
+    num_questions = min(num_questions, BANK_MAX_QUESTIONS)
+    
+    num_batches = max(1, math.ceil(num_questions * BANK_OVERGENERATION / BANK_BATCH_SIZE))
+    windows = split_transcript_windows(transcript) if estimate_tokens(transcript) > LONG_TRANSCRIPT_WINDOW_TOKENS else [transcript]
+    subtopics = extract_subtopics(transcript, num_batches)
+    
+    model = get_gemini_model(api_key)
+    
+    def run_batch(index):
+        window = windows[index % len(windows)]
+        focus = subtopics[index] if index < len(subtopics) else None
+        questions, _dropped, _raw = request_questions_with_repair(
+            model, window, BANK_BATCH_SIZE, question_type, schema_mode, focus=focus
+        )
+        return questions
+    
+    batches = [[] for _ in range(num_batches)]
+    failed_batches = 0
+    with ThreadPoolExecutor(max_workers=min(BANK_WORKERS, num_batches)) as executor:
+        futures = {submit_in_context(executor, run_batch, i): i for i in range(num_batches)}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                batches[futures[future]] = future.result()
+            except Exception:
+                failed_batches += 1
+            if on_progress:
+                on_progress(done, num_batches)
+    
+    # Manter a ordem dos lotes para o resultado não depender de qual terminou primeiro
+    candidates = [q for batch in batches for q in batch]
+    questions, duplicates = remove_near_duplicates(candidates)
+    report = {
+        "batches": num_batches,
+        "failed_batches": failed_batches,
+        "generated": len(candidates),
+        "duplicates_removed": duplicates,
+        "dedup_ratio": duplicates / len(candidates) if candidates else 0.0
+    }
+    return questions[:num_questions], report
+
+def build_question_bank(transcript, api_key, num_questions=200, question_type="dissertativa", force_regenerate=False):
+    """Gera o banco de questões exibindo o progresso dos lotes e o resultado da deduplicação"""
+    schema_mode = QUESTION_SCHEMA_MODE
+    cache = get_question_cache()
+    cache_key = QuestionCache.make_key(
+        transcript, num_questions, question_type, variant="bank" + ("+schema" if schema_mode else "")
+    )
+    if not force_regenerate:
+        cached_questions = cache.get(cache_key)
+        if cached_questions:
+            st.info("♻️ Banco de questões recuperado do cache (nenhuma chamada à IA foi necessária).")
+            return cached_questions
+    
+    try:
+        progress = st.progress(0.0, text="Gerando lotes de perguntas...")
+        questions, report = generate_question_bank(
+            transcript, api_key, num_questions, question_type, schema_mode,
+            on_progress=lambda done, total: progress.progress(done / total, text=f"Lotes concluídos: {done}/{total}")
+        )
+        progress.empty()
+        
+        st.caption(
+            f"Banco de questões: {report['generated']} perguntas geradas em {report['batches']} lotes, "
+            f"{report['duplicates_removed']} quase repetidas removidas ({report['dedup_ratio']:.0%})"
+        )
+        if report['failed_batches']:
+            st.warning(f"⚠️ {report['failed_batches']} lote(s) falharam.")
+        if len(questions) < num_questions:
+            st.warning(f"⚠️ Foram obtidas {len(questions)} perguntas distintas de {num_questions} pedidas.")
+        
+        if questions:
+            cache.set(cache_key, questions)
+        else:
+            st.error("Nenhuma pergunta válida foi gerada.")
+        return questions
+    except Exception as e:
+        st.error(f"Erro ao gerar o banco de questões: {str(e)}")
+        return []
+
+class QuestionBankStore:
+    """Banco de questões persistente em SQLite, com consultas paginadas e exportação em streaming"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    video_id TEXT NOT NULL,
+                    question_type TEXT NOT NULL,
+                    transcript_method TEXT,
+                    question_hash TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (video_id, question_type, question_hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_video ON questions (video_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_type ON questions (question_type)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_created ON questions (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_method ON questions (transcript_method)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _where(video_id=None, question_type=None, transcript_method=None, since=None, until=None):
+        clauses = []
+        params = []
+        for column, value in (("video_id", video_id), ("question_type", question_type), ("transcript_method", transcript_method)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    @staticmethod
+    def _row(row):
+        return {
+            "id": row[0],
+            "video_id": row[1],
+            "question_type": row[2],
+            "transcript_method": row[3],
+            "created_at": row[4],
+            "question": json.loads(row[5])
+        }
+
+    def add(self, video_id, question_type, questions, transcript_method=None):
+        """Grava as perguntas; perguntas já existentes para o mesmo vídeo e tipo são ignoradas
+        
+        Retorna quantas perguntas novas foram gravadas.
+        """
+        now = time.time()
+        rows = []
+        for question in questions:
+            payload = json.dumps(question, ensure_ascii=False, sort_keys=True)
+            rows.append((
+                video_id, question_type, transcript_method,
+                hashlib.sha256(payload.encode("utf-8")).hexdigest(), payload, now
+            ))
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                """INSERT OR IGNORE INTO questions
+                   (video_id, question_type, transcript_method, question_hash, payload, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            return conn.total_changes - before
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM questions{where}", params).fetchone()[0]
+
+    def page(self, page=1, page_size=50, **filters):
+        """Retorna uma página de perguntas (das mais recentes para as mais antigas)"""
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""SELECT id, video_id, question_type, transcript_method, created_at, payload
+                    FROM questions{where} ORDER BY id DESC LIMIT ? OFFSET ?""",
+                params + [page_size, (max(page, 1) - 1) * page_size]
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def iter_questions(self, batch_size=1000, **filters):
+        """Percorre todas as perguntas do filtro em ordem, lendo um lote por vez (paginação por id)"""
+        where, params = self._where(**filters)
+        where += (" AND" if where else " WHERE") + " id > ?"
+        last_id = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    f"""SELECT id, video_id, question_type, transcript_method, created_at, payload
+                        FROM questions{where} ORDER BY id LIMIT ?""",
+                    params + [last_id, batch_size]
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._row(row)
+            last_id = rows[-1][0]
+
+@st.cache_resource
+def get_question_bank_store():
+    """Instância única do banco de questões, compartilhada entre as sessões"""
+    return QuestionBankStore(os.path.join(CACHE_DIR, "questions.sqlite3"))
+
+def save_questions_to_bank(video_id, question_type, questions, transcript_method=None):
+    """Grava as perguntas geradas no banco de questões, sem interromper o fluxo em caso de erro"""
+    try:
+        return get_question_bank_store().add(video_id, question_type, questions, transcript_method)
+    except sqlite3.Error:
+        return 0
+
+def export_jsonl(rows):
+    """Exporta as perguntas como JSON Lines, uma linha por vez"""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+def export_csv(rows):
+    """Exporta as perguntas como CSV (opções de múltipla escolha em colunas a–e)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "video_id", "question_type", "transcript_method", "created_at",
+                     "pergunta", "resposta", "a", "b", "c", "d", "e", "resposta_correta", "explicacao"])
+    for row in rows:
+        question = row["question"]
+        options = question.get("opcoes", {})
+        writer.writerow([
+            row["id"], row["video_id"], row["question_type"], row["transcript_method"], row["created_at"],
+            question.get("pergunta", ""), question.get("resposta", ""),
+            *[options.get(letter, "") for letter in "abcde"],
+            question.get("resposta_correta", ""), question.get("explicacao", "")
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def _gift_escape(text):
+    return re.sub(r'([~=#{}:\\])', r'\\\1', str(text))
+
+def export_gift(rows):
+    """Exporta as perguntas no formato GIFT do Moodle"""
+    for row in rows:
+        question = row["question"]
+        title = f"::{row['video_id']}-{row['id']}::"
+        if row["question_type"] == "multipla_escolha":
+            answers = []
+            for letter, option in question["opcoes"].items():
+                prefix = "=" if letter == question.get("resposta_correta") else "~"
+                answers.append(f"\t{prefix}{_gift_escape(option)}")
+            feedback = f"\t####{_gift_escape(question['explicacao'])}\n" if question.get("explicacao") else ""
+            yield f"{title}{_gift_escape(question['pergunta'])} {{\n" + "\n".join(answers) + f"\n{feedback}}}\n\n"
+        else:
+            # Dissertativa: questão de ensaio, com a resposta esperada como comentário
+            yield f"// Resposta esperada: {' '.join(str(question.get('resposta', '')).split())}\n"
+            yield f"{title}{_gift_escape(question['pergunta'])} {{}}\n\n"
+
+def export_qti(rows):
+    """Exporta as perguntas em IMS QTI 1.2 (aceito pelo Moodle e por outros LMS)"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<questestinterop>\n<assessment ident="spotquest" title="SpotQuest">\n<section ident="root">\n'
+    for row in rows:
+        question = row["question"]
+        ident = f"q{row['id']}"
+        item = [f'<item ident="{ident}" title="{xml_escape(row["video_id"])}">',
+                f'<presentation><material><mattext texttype="text/plain">{xml_escape(question["pergunta"])}</mattext></material>']
+        if row["question_type"] == "multipla_escolha":
+            item.append('<response_lid ident="resposta" rcardinality="Single"><render_choice>')
+            for letter, option in question["opcoes"].items():
+                item.append(f'<response_label ident="{letter}"><material><mattext>{xml_escape(option)}</mattext></material></response_label>')
+            item.append('</render_choice></response_lid></presentation>')
+            item.append('<resprocessing><outcomes><decvar/></outcomes><respcondition title="correct">')
+            item.append(f'<conditionvar><varequal respident="resposta">{xml_escape(question.get("resposta_correta", ""))}</varequal></conditionvar>')
+            item.append('<setvar action="Set">100</setvar></respcondition></resprocessing>')
+            if question.get("explicacao"):
+                item.append(f'<itemfeedback ident="explicacao"><material><mattext>{xml_escape(question["explicacao"])}</mattext></material></itemfeedback>')
+        else:
+            item.append('<response_str ident="resposta" rcardinality="Single"><render_fib rows="10"/></response_str></presentation>')
+            item.append(f'<itemfeedback ident="resposta_esperada"><material><mattext>{xml_escape(question.get("resposta", ""))}</mattext></material></itemfeedback>')
+        item.append("</item>\n")
+        yield "".join(item)
+    yield "</section>\n</assessment>\n</questestinterop>\n"
+
+# Formatos de exportação: (função geradora, extensão, tipo MIME)
+EXPORT_FORMATS = {
+    "jsonl": (export_jsonl, "jsonl", "application/jsonl"),
+    "csv": (export_csv, "csv", "text/csv"),
+    "gift": (export_gift, "gift.txt", "text/plain"),
+    "qti": (export_qti, "qti.xml", "application/xml")
+}
+
+def export_question_bank(out, fmt="jsonl", store=None, **filters):
+    """Escreve o banco de questões filtrado em out sem carregá-lo inteiro na memória
+    
+    Retorna quantas perguntas foram exportadas.
+    """
+    store = store or get_question_bank_store()
+    exporter = EXPORT_FORMATS[fmt][0]
+    exported = 0
+    
+    def counted(rows):
+        nonlocal exported
+        for row in rows:
+            exported += 1
+            yield row
+    
+    for chunk in exporter(counted(store.iter_questions(**filters))):
+        out.write(chunk)
+    return exported
+
+def export_command_line(fmt, video_id=None, question_type=None, transcript_method=None):
+    """Monta o comando do subcomando export equivalente aos filtros da interface"""
+    command = ["python", "src/main.py", "export", "--format", fmt, "--out", f"banco_de_questoes.{EXPORT_FORMATS[fmt][1]}"]
+    if video_id:
+        command += ["--video-id", video_id]
+    if question_type:
+        command += ["--question-type", question_type]
+    if transcript_method:
+        command += ["--transcript-method", transcript_method]
+    return shlex.join(command)
+
+def render_question_bank():
+    """Exibe o banco de questões salvo, com filtros, paginação e exportação"""
+    with st.expander("🗄️ Banco de questões salvo", expanded=False):
+        store = get_question_bank_store()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            video_filter = st.text_input("ID do vídeo", value="", key="bank_video_filter")
+        with col2:
+            type_filter = st.selectbox(
+                "Tipo", options=["", "dissertativa", "multipla_escolha"], key="bank_type_filter",
+                format_func=lambda x: x or "Todos"
+            )
+        with col3:
+            method_filter = st.selectbox(
+                "Método da transcrição", options=[""] + TRANSCRIPT_METHODS, key="bank_method_filter",
+                format_func=lambda x: x or "Todos"
+            )
+        filters = {"video_id": video_filter.strip() or None, "question_type": type_filter or None,
+                   "transcript_method": method_filter or None}
+        
+        total = store.count(**filters)
+        page_size = 50
+        pages = max(1, math.ceil(total / page_size))
+        page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, value=1, key="bank_page")
+        st.caption(f"{total} pergunta(s) no banco com os filtros atuais.")
+        
+        for row in store.page(int(page), page_size, **filters):
+            st.markdown(f"**{row['question']['pergunta']}** — `{row['video_id']}` · {row['question_type']}")
+        
+        fmt = st.selectbox("Formato de exportação", options=list(EXPORT_FORMATS), key="bank_export_format")
+        if st.button("Preparar exportação", key="bank_export"):
+            _, extension, mime = EXPORT_FORMATS[fmt]
+            # Arquivo temporário próprio desta exportação: sessões simultâneas com filtros
+            # diferentes não podem sobrescrever o arquivo uma da outra
+            with tempfile.NamedTemporaryFile("w+", suffix=f".{extension}", encoding="utf-8", newline="") as out:
+                exported = export_question_bank(out, fmt, store, **filters)
+                out.flush()
+                # O download_button mantém os bytes na memória da sessão; exportações grandes
+                # ficam para a linha de comando, que escreve direto no arquivo de saída
+                size_mb = os.path.getsize(out.name) / (1024 * 1024)
+                if size_mb > BANK_EXPORT_MAX_MB:
+                    st.warning(
+                        f"⚠️ A exportação tem {size_mb:.1f} MB, acima do limite de {BANK_EXPORT_MAX_MB:g} MB "
+                        "para download pela interface. Use a linha de comando:"
+                    )
+                    st.code(export_command_line(fmt, **filters), language="bash")
+                    return
+                with open(out.name, "rb") as exported_file:
+                    st.download_button(
+                        label=f"Baixar {exported} pergunta(s) ({fmt.upper()})",
+                        data=exported_file.read(),
+                        file_name=f"banco_de_questoes.{extension}",
+                        mime=mime
+                    )
+
+def check_answer(question_idx, selected_option):
+    """Verifica se a resposta selecionada está correta e atualiza o estado"""
+    question = st.session_state.questions[question_idx]
+    st.session_state[f"resposta_selecionada_{question_idx}"] = selected_option
+    st.session_state[f"mostrar_resultado_{question_idx}"] = True
 
 def on_generate_click():
     """Função chamada quando o botão de gerar perguntas é clicado"""
     st.session_state.has_generated = False
     st.session_state.questions = []
 
+def render_streamed_questions(questions_iter):
+    """Exibe as perguntas à medida que chegam e as acumula em st.session_state.questions"""
+    st.session_state.questions = []
+    placeholder = st.empty()
+    container = placeholder.container()
+    for question in questions_iter:
+        st.session_state.questions.append(question)
+        container.markdown(f"**Pergunta {len(st.session_state.questions)}:** {question['pergunta']}")
+    
+    # A prévia é substituída pela exibição completa (abas/expansores) após a geração
+    placeholder.empty()
+    return st.session_state.questions
+
 def render_header():
     """Renderiza o cabeçalho da aplicação"""
     st.markdown("<h1>⚡ SpotQuest - Gerador de Perguntas do YouTube</h1>", unsafe_allow_html=True)
@@ -936,6 +3765,228 @@ def render_api_settings():
         if st.button("Salvar Chaves de API"):
             save_api_keys(gemini_key, openai_key)
             st.success("✅ Chaves de API salvas com sucesso!")
+        
+        # Métricas do agendador compartilhado de chamadas às APIs
+        queues = get_api_scheduler().snapshot()
+        if queues:
+            st.caption("Filas de chamadas às APIs (todas as sessões)")
+            st.dataframe(queues, hide_index=True)
+
+class JobEngine:
+    """Executa o pipeline em segundo plano, fora da thread do script do Streamlit
+    
+    Cada tarefa tem um id e informa a etapa atual; a interface consulta o estado a cada
+    execução do script, então recarregar a página ou interagir com widgets não perde o
+    trabalho. Tarefas abandonadas continuam até o fim e deixam os caches preenchidos.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="spotquest-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Tarefa da thread atual (usada por report_stage); fica na instância compartilhada, não
+        # no módulo, que o Streamlit recria a cada execução do script
+        self.current_job = contextvars.ContextVar("current_job", default=None)
+
+    def submit(self, youtube_url, gemini_key, openai_key=None, **options):
+        """Agenda o processamento do vídeo e retorna o id da tarefa
+        
+        Um pedido idêntico a uma tarefa ainda em andamento reaproveita essa tarefa.
+        """
+        fingerprint = hashlib.sha256(
+            json.dumps([youtube_url, sorted(options.items())], default=str).encode("utf-8")
+        ).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            for job in self._jobs.values():
+                if job["fingerprint"] == fingerprint and job["status"] in ("queued", "running"):
+                    return job["id"]
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                "id": job_id,
+                "fingerprint": fingerprint,
+                "url": youtube_url,
+                "options": options,
+                "status": "queued",
+                "stage": "queued",
+                "detail": None,
+                "progress": 0.0,
+                "result": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now
+            }
+        self._executor.submit(self._run, job_id, youtube_url, gemini_key, openai_key, options)
+        return job_id
+
+    def _run(self, job_id, youtube_url, gemini_key, openai_key, options):
+        token = self.current_job.set(job_id)
+        self.update(job_id, status="running")
+        try:
+            record = process_video(youtube_url, gemini_key, openai_key, **options)
+            self.update(
+                job_id,
+                status="done" if record["status"] == "ok" else "error",
+                stage="done",
+                result=record,
+                error=record.get("error")
+            )
+        except Exception as e:
+            self.update(job_id, status="error", stage="done", error=str(e))
+        finally:
+            self.current_job.reset(token)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            job.update(fields)
+            if "stage" in fields:
+                stage = fields["stage"]
+                job["progress"] = 1.0 if stage == "done" else JOB_STAGES.index(stage) / len(JOB_STAGES) if stage in JOB_STAGES else job["progress"]
+            job["updated_at"] = time.time()
+
+    def get(self, job_id):
+        """Cópia do estado atual da tarefa (ou None, se não existir ou tiver expirado)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def recent(self, limit=10):
+        """Tarefas mais recentes, sem o resultado"""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j["created_at"], reverse=True)[:limit]
+            return [{k: v for k, v in job.items() if k != "result"} for job in jobs]
+
+    def _prune(self, now):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in ("done", "error") and now - job["updated_at"] > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+@st.cache_resource
+def get_job_engine():
+    """Instância única do executor de tarefas, compartilhada entre as sessões"""
+    return JobEngine()
+
+def report_stage(stage, detail=None):
+    """Informa a etapa atual à tarefa em segundo plano em execução (sem efeito fora de uma tarefa)"""
+    engine = get_job_engine()
+    job_id = engine.current_job.get()
+    if job_id:
+        engine.update(job_id, stage=stage, detail=detail)
+
+def attach_job(job_id):
+    """Passa a acompanhar a tarefa nesta sessão e na URL, para sobreviver a recarregamentos"""
+    st.session_state.job_id = job_id
+    st.query_params["job"] = job_id
+
+def job_in_progress(job_id):
+    job = get_job_engine().get(job_id)
+    return bool(job) and job["status"] in ("queued", "running")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job_status(job_id):
+    """Atualiza apenas o andamento da tarefa, sem bloquear o resto da página
+    
+    Quando a tarefa termina, a página inteira é executada de novo para exibir o resultado.
+    """
+    if job_in_progress(job_id):
+        render_job_status(job_id)
+    else:
+        st.rerun()
+
+def render_job_status(job_id):
+    """Exibe o andamento da tarefa; retorna True enquanto ela ainda estiver em execução"""
+    job = get_job_engine().get(job_id)
+    if not job:
+        st.warning("A tarefa em segundo plano não foi encontrada (ela pode ter expirado).")
+        st.session_state.job_id = None
+        st.query_params.pop("job", None)
+        return False
+    
+    if job["status"] in ("queued", "running"):
+        label = JOB_STAGE_LABELS.get(job["stage"], job["stage"])
+        if job["detail"]:
+            label += f" ({job['detail']})"
+        st.progress(job["progress"], text=f"⏳ {label}...")
+        st.caption(f"Tarefa {job['id']}: você pode recarregar a página ou voltar depois, o processamento continua.")
+        return True
+    
+    if job["status"] == "done" and st.session_state.get("loaded_job_id") != job_id:
+        record = job["result"]
+        st.session_state.questions = record["questions"]
+        st.session_state.question_type = record["question_type"]
+        st.session_state.transcript_method = record.get("transcript_method")
+        st.session_state.has_generated = True
+        st.session_state.loaded_job_id = job_id
+        st.session_state.last_trace_id = record.get("trace_id")
+        for i in range(len(record["questions"])):
+            st.session_state[f"resposta_selecionada_{i}"] = None
+            st.session_state[f"mostrar_resultado_{i}"] = False
+        st.success(f"✅ Perguntas geradas com sucesso em {record['elapsed_seconds']}s!")
+    elif job["status"] == "error":
+        st.error(f"A tarefa {job['id']} falhou: {job['error']}")
+    return False
+
+def render_recent_jobs():
+    """Lista as tarefas em segundo plano recentes para acompanhar qualquer uma delas"""
+    jobs = get_job_engine().recent()
+    if not jobs:
+        return
+    with st.expander("🗂️ Tarefas em segundo plano", expanded=False):
+        for job in jobs:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.markdown(
+                    f"`{job['id']}` {job['url']} — **{job['status']}** "
+                    f"({JOB_STAGE_LABELS.get(job['stage'], job['stage'])})"
+                )
+            with col2:
+                if st.button("Acompanhar", key=f"attach_job_{job['id']}"):
+                    attach_job(job["id"])
+                    st.rerun()
+
+def render_startup_report():
+    """Exibe o tempo de importação de cada provedor e o tempo até a primeira página"""
+    report = get_provider_registry().report()
+    with st.expander("⏱️ Diagnóstico de inicialização", expanded=False):
+        first_render = report["first_render_seconds"]
+        if first_render is not None:
+            status = "✅" if first_render <= report["target_seconds"] else "⚠️"
+            st.caption(
+                f"{status} Primeira página renderizada em {first_render:.2f}s "
+                f"(meta: {report['target_seconds']:.1f}s)"
+            )
+        st.dataframe(report["providers"], hide_index=True)
+
+def render_debug_panel():
+    """Spans da última geração e latências p50/p95 por etapa (SPOTQUEST_DEBUG_PANEL=1 ou ?debug=1)"""
+    tracer = get_tracer()
+    with st.expander("🐞 Depuração: etapas do pipeline", expanded=False):
+        trace_id = st.session_state.get("last_trace_id")
+        if trace_id:
+            spans = tracer.recent(trace_id)
+            st.markdown(f"**Última geração** (trace `{trace_id}`)")
+            if spans:
+                st.dataframe(spans, hide_index=True)
+            else:
+                st.caption("Os spans desta geração já saíram do histórico recente.")
+        
+        summary = tracer.percentiles()
+        if summary:
+            st.markdown("**Latência por etapa** (spans recentes do processo)")
+            st.dataframe(summary, hide_index=True)
+        else:
+            st.caption("Nenhuma etapa medida ainda.")
+        
+        if METRICS_PORT:
+            st.caption(f"Métricas do Prometheus em http://{METRICS_HOST}:{METRICS_PORT}/metrics")
 
 def main():
     st.set_page_config(
@@ -950,6 +4001,17 @@ def main():
     # Carregar chaves de API salvas
     load_api_keys()
     
+    # Pré-carregar os modelos Vosk, se configurado
+    if VOSK_WARMUP:
+        warm_up_vosk_models()
+    
+    # Endpoint /metrics para o Prometheus, se configurado
+    if METRICS_PORT:
+        try:
+            get_metrics_server(METRICS_PORT)
+        except OSError as e:
+            st.warning(f"Não foi possível iniciar o servidor de métricas na porta {METRICS_PORT}: {str(e)}")
+    
     # Renderizar cabeçalho
     render_header()
     
@@ -976,10 +4038,58 @@ def main():
             format_func=lambda x: "Dissertativas" if x == "dissertativa" else "Múltipla Escolha (a, b, c, d, e)"
         )
         
+        stream_questions = st.checkbox(
+            "Exibir perguntas à medida que são geradas",
+            value=True,
+            help="As perguntas aparecem uma a uma durante a geração (não se aplica a transcrições longas)."
+        )
+        
+        bank_mode = st.checkbox(
+            "Modo banco de questões",
+            value=False,
+            help="Gera centenas de perguntas em lotes paralelos e remove as quase repetidas."
+        )
+        
+        bank_size = st.number_input(
+            "Tamanho do banco de questões",
+            min_value=20,
+            max_value=BANK_MAX_QUESTIONS,
+            value=min(200, BANK_MAX_QUESTIONS),
+            step=10,
+            help="Usado apenas no modo banco de questões."
+        )
+        
+        token_budget = st.number_input(
+            "Orçamento de tokens da transcrição (0 = sem limite)",
+            min_value=0,
+            value=TRANSCRIPT_TOKEN_BUDGET,
+            step=1000,
+            help="Transcrições acima do orçamento são reduzidas antes de serem enviadas ao modelo."
+        )
+        
+        force_regenerate = st.checkbox(
+            "Forçar nova geração (ignorar cache)",
+            value=False,
+            help="Por padrão, gerações idênticas reutilizam as perguntas já geradas sem custo de tokens."
+        )
+        
+        run_in_background = st.checkbox(
+            "Processar em segundo plano",
+            value=False,
+            help=(
+                "A geração continua mesmo se a página for recarregada; o andamento é atualizado automaticamente. "
+                "Neste modo não há exibição das perguntas à medida que são geradas, prévia/edição da "
+                "transcrição nem entrada manual quando nenhum método automático funciona."
+            )
+        )
+        
         submitted = st.form_submit_button("Gerar Perguntas", on_click=on_generate_click)
     
     # Processar o formulário quando enviado
     if submitted:
+        # Spans desta execução ficam agrupados no mesmo trace (painel de depuração)
+        st.session_state.last_trace_id = start_trace()
+        
         if not youtube_url:
             st.error("Por favor, insira uma URL do YouTube.")
             return
@@ -993,42 +4103,100 @@ def main():
             st.error("URL do YouTube inválida. Por favor, insira uma URL válida.")
             return
         
-        with st.spinner("Verificando disponibilidade do vídeo e buscando transcrição..."):
-            # Usar o método com fallback, incluindo a chave da OpenAI se disponível
-            transcript_result = get_youtube_transcript_with_fallback(
-                video_id, 
-                openai_key=openai_api_key if openai_api_key else None
-            )
+        if run_in_background:
+            attach_job(get_job_engine().submit(
+                youtube_url, gemini_api_key, openai_api_key or None,
+                num_questions=int(bank_size) if bank_mode else num_questions,
+                question_type=question_type,
+                force_regenerate=force_regenerate,
+                token_budget=int(token_budget),
+                bank=bank_mode,
+                priority=PRIORITY_INTERACTIVE
+            ))
+        else:
+            # Processamento síncrono: deixar de acompanhar tarefas anteriores
+            st.session_state.job_id = None
+            st.query_params.pop("job", None)
+            
+            with st.spinner("Verificando disponibilidade do vídeo e buscando transcrição..."):
+                # Usar o método com fallback, incluindo a chave da OpenAI se disponível
+                transcript_result = get_youtube_transcript_with_fallback(
+                    video_id, 
+                    openai_key=openai_api_key if openai_api_key else None
+                )
         
-            if not transcript_result[0]:
-                st.error("Não foi possível obter nenhuma informação sobre o vídeo.")
-                return
+                if not transcript_result[0]:
+                    st.error("Não foi possível obter nenhuma informação sobre o vídeo.")
+                    return
         
-            transcript, is_synthetic = transcript_result
+                transcript, is_synthetic = transcript_result
         
-            # Exibir prévia da transcrição
-            transcript = display_transcript_preview(transcript, is_synthetic)
+                # Exibir prévia da transcrição
+                transcript = display_transcript_preview(transcript, is_synthetic)
+            
+                # Reduzir os tokens enviados ao modelo
+                transcript, token_report = compress_transcript(transcript, int(token_budget))
+                st.caption(
+                    f"Transcrição otimizada: ~{token_report['tokens_before']} → ~{token_report['tokens_after']} tokens "
+                    f"({token_report['markers_removed']} marcações, {token_report['fillers_removed']} hesitações e "
+                    f"{token_report['duplicates_removed']} frases repetidas removidas"
+                    + (", cortada pelo orçamento" if token_report['truncated'] else "") + ")"
+                )
         
-            with st.spinner("Gerando perguntas com IA..."):
-                questions = generate_questions(transcript, gemini_api_key, num_questions, question_type)
+                with st.spinner("Gerando perguntas com IA..."):
+                    if bank_mode:
+                        questions = build_question_bank(
+                            transcript, gemini_api_key, int(bank_size), question_type,
+                            force_regenerate=force_regenerate
+                        )
+                    elif stream_questions and estimate_tokens(transcript) <= LONG_TRANSCRIPT_TOKENS:
+                        questions = render_streamed_questions(generate_questions_stream(
+                            transcript, gemini_api_key, num_questions, question_type,
+                            force_regenerate=force_regenerate
+                        ))
+                    else:
+                        questions = generate_questions(
+                            transcript, gemini_api_key, num_questions, question_type,
+                            force_regenerate=force_regenerate
+                        )
             
-                if not questions:
-                    st.error("Falha ao gerar perguntas.")
-                    return
+                    if not questions:
+                        st.error("Falha ao gerar perguntas.")
+                        return
             
-                # Salvar as perguntas e o tipo no estado da sessão
-                st.session_state.questions = questions
-                st.session_state.question_type = question_type
-                st.session_state.has_generated = True
+                    # Salvar as perguntas e o tipo no estado da sessão
+                    st.session_state.questions = questions
+                    st.session_state.question_type = question_type
+                    st.session_state.has_generated = True
             
-                # Inicializar o estado para cada pergunta
-                for i in range(len(questions)):
-                    if f"resposta_selecionada_{i}" not in st.session_state:
-                        st.session_state[f"resposta_selecionada_{i}"] = None
-                    if f"mostrar_resultado_{i}" not in st.session_state:
-                        st.session_state[f"mostrar_resultado_{i}"] = False
+                    # Inicializar o estado para cada pergunta
+                    for i in range(len(questions)):
+                        if f"resposta_selecionada_{i}" not in st.session_state:
+                            st.session_state[f"resposta_selecionada_{i}"] = None
+                        if f"mostrar_resultado_{i}" not in st.session_state:
+                            st.session_state[f"mostrar_resultado_{i}"] = False
             
-                st.success("✅ Perguntas geradas com sucesso!")
+                    st.success("✅ Perguntas geradas com sucesso!")
+                
+                    saved = save_questions_to_bank(video_id, question_type, questions, st.session_state.transcript_method)
+                    if saved:
+                        st.caption(f"{saved} pergunta(s) nova(s) salva(s) no banco de questões.")
+                
+                    cache_stats = get_question_cache().stats()
+                    st.caption(
+                        f"Cache de perguntas: {cache_stats['hits']} acertos, {cache_stats['misses']} falhas "
+                        f"({cache_stats['hit_rate']:.0%} de aproveitamento, {cache_stats['size']} entradas)"
+                    )
+    
+    
+    # Acompanhar a tarefa em segundo plano desta sessão (ou indicada na URL)
+    job_id = st.session_state.job_id or st.query_params.get("job")
+    if job_id:
+        st.session_state.job_id = job_id
+        if job_in_progress(job_id):
+            poll_job_status(job_id)
+        else:
+            render_job_status(job_id)
     
     # Exibir perguntas se elas foram geradas
     if st.session_state.has_generated and st.session_state.questions:
@@ -1036,8 +4204,11 @@ def main():
         
         # Exibir perguntas de acordo com o tipo
         if st.session_state.question_type == "multipla_escolha":
-            # Criar abas para cada pergunta
-            tabs = st.tabs([f"Pergunta {i+1}" for i in range(len(st.session_state.questions))])
+            # Criar abas para cada pergunta (bancos grandes usam seções recolhíveis)
+            if len(st.session_state.questions) <= 20:
+                tabs = st.tabs([f"Pergunta {i+1}" for i in range(len(st.session_state.questions))])
+            else:
+                tabs = [st.expander(f"Pergunta {i+1}: {q['pergunta']}") for i, q in enumerate(st.session_state.questions)]
             
             for i, (tab, question) in enumerate(zip(tabs, st.session_state.questions)):
                 with tab:
@@ -1079,8 +4250,514 @@ def main():
             mime="application/json"
         )
     
+    # Tarefas em segundo plano e banco de questões persistente
+    render_recent_jobs()
+    render_question_bank()
+    
+    # Tempo até a primeira página deste processo (partida a frio)
+    get_provider_registry().record_first_render(time.perf_counter() - _SCRIPT_STARTED)
+    render_startup_report()
+    
+    if DEBUG_PANEL or st.query_params.get("debug") == "1":
+        render_debug_panel()
+    
     # Renderizar footer
     render_footer()
 
+def process_video(youtube_url, gemini_key, openai_key=None, num_questions=5, question_type="dissertativa", force_regenerate=False, token_budget=None, bank=False, priority=PRIORITY_BATCH):
+    """Executa o pipeline completo (transcrição + perguntas) para um vídeo, sem interface
+    
+    Sempre retorna um registro serializável em JSON; falhas são descritas em "error", e as
+    que não mudam ao repetir (como uma URL inválida) vêm com "retryable" igual a False.
+    Por padrão as chamadas às APIs feitas aqui ficam atrás das interativas na fila do agendador.
+    """
+    started_at = time.time()
+    current_priority = get_api_scheduler().current_priority
+    priority_token = current_priority.set(priority)
+    current_trace = get_tracer().current_trace
+    trace_token = current_trace.set(uuid.uuid4().hex[:16])
+    record = {
+        "url": youtube_url,
+        "video_id": None,
+        "status": "error",
+        "question_type": question_type,
+        "questions": []
+    }
+    
+    try:
+        video_id = extract_video_id(youtube_url)
+        record["video_id"] = video_id
+        if not video_id:
+            record["error"] = "URL do YouTube inválida"
+            record["retryable"] = False
+            return record
+        
+        report_stage("transcript")
+        transcript_result = fetch_transcript_with_fallback(
+            video_id, openai_key=openai_key, gemini_key=gemini_key, interactive=False
+        )
+        if not transcript_result:
+            record["error"] = "Não foi possível obter a transcrição"
+            return record
+        
+        record["transcript_method"] = transcript_result["method"]
+        record["transcript_language"] = transcript_result["language"]
+        record["is_synthetic"] = transcript_result["is_synthetic"]
+        
+        report_stage("compress")
+        transcript, record["transcript_tokens"] = compress_transcript(
+            transcript_result["transcript"], token_budget, transcript_result["language"]
+        )
+        
+        report_stage("questions")
+        if bank:
+            questions, record["bank"] = generate_question_bank(transcript, gemini_key, num_questions, question_type)
+        else:
+            questions = generate_questions(
+                transcript, gemini_key, num_questions, question_type,
+                force_regenerate=force_regenerate
+            )
+        if not questions:
+            record["error"] = "Falha ao gerar perguntas"
+            return record
+        
+        record["questions"] = questions
+        report_stage("save")
+        record["saved_to_bank"] = save_questions_to_bank(video_id, question_type, questions, transcript_result["method"])
+        record["status"] = "ok"
+        return record
+    except Exception as e:
+        record["error"] = str(e)
+        return record
+    finally:
+        record["trace_id"] = current_trace.get()
+        current_trace.reset(trace_token)
+        current_priority.reset(priority_token)
+        record["elapsed_seconds"] = round(time.time() - started_at, 2)
+
+class VideoJobQueue:
+    """Fila durável de vídeos em SQLite, compartilhada por vários workers
+    
+    Um worker arrenda (lease) uma tarefa por um tempo de visibilidade; se ele morrer sem
+    concluir, a tarefa volta a ficar visível para outro worker. Falhas transitórias são
+    repetidas com espera crescente até max_attempts; as determinísticas falham de imediato.
+    A conclusão é idempotente (a primeira vence).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS video_jobs (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_video_jobs_status ON video_jobs (status, available_at)")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE reserva a escrita já no início, então dois workers nunca arrendam a mesma tarefa
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def job_id_for(url, options):
+        """Id determinístico: enfileirar o mesmo pedido duas vezes não duplica o trabalho"""
+        payload = json.dumps([url, sorted(options.items())], default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def enqueue(self, url, max_attempts=QUEUE_MAX_ATTEMPTS, **options):
+        """Adiciona o vídeo à fila (se ainda não estiver lá) e retorna o id da tarefa"""
+        job_id = self.job_id_for(url, options)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                """INSERT OR IGNORE INTO video_jobs
+                   (id, url, options, status, max_attempts, available_at, created_at, updated_at)
+                   VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)""",
+                (job_id, url, json.dumps(options), max_attempts, now, now, now)
+            )
+        return job_id
+
+    def lease(self, worker_id, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT):
+        """Arrenda a próxima tarefa disponível; retorna (id, url, opções, tentativa) ou None"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Arrendamentos vencidos que já esgotaram as tentativas não voltam para a fila
+            conn.execute(
+                """UPDATE video_jobs SET status = 'failed', error = COALESCE(error, 'lease expirado'), updated_at = ?
+                   WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= max_attempts""",
+                (now, now)
+            )
+            row = conn.execute(
+                """SELECT id, url, options, attempts FROM video_jobs
+                   WHERE (status = 'pending' AND available_at <= ?)
+                      OR (status = 'leased' AND lease_expires_at < ?)
+                   ORDER BY available_at LIMIT 1""",
+                (now, now)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                """UPDATE video_jobs
+                   SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?, updated_at = ?
+                   WHERE id = ?""",
+                (worker_id, now + visibility_timeout, now, row[0])
+            )
+        return row[0], row[1], json.loads(row[2]), row[3] + 1
+
+    def heartbeat(self, job_id, worker_id, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT):
+        """Estende o arrendamento; retorna False se a tarefa não pertence mais a este worker"""
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute(
+                """UPDATE video_jobs SET lease_expires_at = ?, updated_at = ?
+                   WHERE id = ? AND status = 'leased' AND lease_owner = ?""",
+                (now + visibility_timeout, now, job_id, worker_id)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, job_id, result):
+        """Marca a tarefa como concluída; chamadas repetidas ou atrasadas não têm efeito"""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                """UPDATE video_jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated_at = ?
+                   WHERE id = ? AND status != 'done'""",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            ).rowcount
+        return updated == 1
+
+    def fail(self, job_id, worker_id, error, retry_delay=QUEUE_RETRY_DELAY, retry=True):
+        """Devolve a tarefa à fila com espera exponencial, ou a marca como falha definitiva
+        
+        Com retry=False (erro que se repetiria igual, como uma URL inválida) a tarefa falha
+        sem gastar as tentativas restantes.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM video_jobs WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (job_id, worker_id)
+            ).fetchone()
+            if not row:
+                return
+            attempts, max_attempts = row
+            if not retry or attempts >= max_attempts:
+                conn.execute(
+                    "UPDATE video_jobs SET status = 'failed', error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                    (error, now, job_id)
+                )
+            else:
+                conn.execute(
+                    """UPDATE video_jobs SET status = 'pending', error = ?, lease_owner = NULL,
+                       available_at = ?, updated_at = ? WHERE id = ?""",
+                    (error, now + retry_delay * (2 ** (attempts - 1)), now, job_id)
+                )
+
+    def get(self, job_id):
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, url, status, attempts, result, error FROM video_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row[0], "url": row[1], "status": row[2], "attempts": row[3],
+            "result": json.loads(row[4]) if row[4] else None, "error": row[5]
+        }
+
+    def stats(self):
+        """Quantidade de tarefas por estado"""
+        with self._transaction() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM video_jobs GROUP BY status").fetchall())
+
+def get_video_job_queue(db_path=None):
+    """Fila durável de vídeos (por padrão em SPOTQUEST_QUEUE_PATH)"""
+    return VideoJobQueue(db_path or QUEUE_PATH)
+
+def run_worker(queue, gemini_key, openai_key=None, worker_id=None, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT,
+               poll_interval=QUEUE_POLL_SECONDS, max_jobs=None, exit_when_empty=False, stop_event=None):
+    """Laço de um worker: arrenda tarefas da fila, executa o pipeline e registra o resultado
+    
+    O arrendamento é renovado em segundo plano enquanto o vídeo é processado.
+    Retorna quantas tarefas foram processadas.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+    processed = 0
+    while not (stop_event and stop_event.is_set()) and (max_jobs is None or processed < max_jobs):
+        leased = queue.lease(worker_id, visibility_timeout)
+        if not leased:
+            if exit_when_empty:
+                break
+            if stop_event:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        
+        job_id, url, options, attempt = leased
+        print(f"[{worker_id}] {job_id} (tentativa {attempt}): {url}", file=sys.stderr)
+        
+        # Renovar o arrendamento para que tarefas longas não voltem a ficar visíveis
+        done = threading.Event()
+        def keep_alive():
+            while not done.wait(visibility_timeout / 3):
+                if not queue.heartbeat(job_id, worker_id, visibility_timeout):
+                    return
+        heartbeat = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat.start()
+        
+        try:
+            record = process_video(url, gemini_key, openai_key, **options)
+        except TypeError as e:
+            # Opções gravadas na tarefa que o pipeline não aceita: repetir não adianta
+            record = {"url": url, "status": "error", "error": str(e), "retryable": False}
+        except Exception as e:
+            record = {"url": url, "status": "error", "error": str(e)}
+        finally:
+            done.set()
+            heartbeat.join()
+        
+        if record["status"] == "ok":
+            queue.complete(job_id, record)
+        else:
+            queue.fail(job_id, worker_id, record.get("error") or "erro desconhecido", retry=record.get("retryable", True))
+        processed += 1
+    return processed
+
+def process_batch(urls, gemini_key, openai_key=None, concurrency=4, **kwargs):
+    """Processa vários vídeos em paralelo, produzindo cada registro assim que o vídeo termina"""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [
+            executor.submit(process_video, url, gemini_key, openai_key, **kwargs)
+            for url in urls
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+def read_url_list(path):
+    """Lê uma lista de URLs (uma por linha, '#' para comentários; '-' para stdin)"""
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in handle if line.strip() and not line.strip().startswith("#")]
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def resolve_cli_api_keys(args):
+    """Obtém as chaves de API dos argumentos, das variáveis de ambiente ou das chaves salvas"""
+    saved_keys = load_api_keys()
+    gemini_key = args.gemini_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or saved_keys.get('gemini')
+    openai_key = args.openai_key or os.environ.get("OPENAI_API_KEY") or saved_keys.get('openai')
+    return gemini_key, openai_key or None
+
+def run_batch_command(args):
+    """Subcomando 'batch': gera perguntas para uma lista de URLs e grava um JSONL"""
+    gemini_key, openai_key = resolve_cli_api_keys(args)
+    if not gemini_key:
+        print("Erro: configure a chave da API Gemini (--gemini-key ou GEMINI_API_KEY).", file=sys.stderr)
+        return 2
+    
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, args.metrics_host)
+    
+    urls = read_url_list(args.urls_file)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    failures = 0
+    try:
+        records = process_batch(
+            urls, gemini_key, openai_key,
+            concurrency=args.concurrency,
+            num_questions=args.num_questions,
+            question_type=args.question_type,
+            force_regenerate=args.force_regenerate,
+            token_budget=args.token_budget,
+            bank=args.bank
+        )
+        for done, record in enumerate(records, 1):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if record["status"] != "ok":
+                failures += 1
+            print(f"[{done}/{len(urls)}] {record['url']}: {record['status']}"
+                  + (f" ({record['error']})" if record.get("error") else ""), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    return 1 if failures else 0
+
+def run_export_command(args):
+    """Subcomando 'export': exporta o banco de questões em streaming"""
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8", newline="")
+    try:
+        exported = export_question_bank(
+            out, args.format,
+            video_id=args.video_id,
+            question_type=args.question_type,
+            transcript_method=args.transcript_method
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{exported} pergunta(s) exportada(s).", file=sys.stderr)
+    return 0
+
+def run_enqueue_command(args):
+    """Subcomando 'enqueue': adiciona URLs à fila durável dos workers"""
+    queue = get_video_job_queue(args.queue)
+    for url in read_url_list(args.urls_file):
+        job_id = queue.enqueue(
+            url,
+            max_attempts=args.max_attempts,
+            num_questions=args.num_questions,
+            question_type=args.question_type,
+            force_regenerate=args.force_regenerate,
+            token_budget=args.token_budget,
+            bank=args.bank
+        )
+        print(f"{job_id}\t{url}")
+    print(f"Fila: {queue.stats()}", file=sys.stderr)
+    return 0
+
+def run_worker_command(args):
+    """Subcomando 'worker': processa tarefas da fila durável até ser interrompido"""
+    gemini_key, openai_key = resolve_cli_api_keys(args)
+    if not gemini_key:
+        print("Erro: configure a chave da API Gemini (--gemini-key ou GEMINI_API_KEY).", file=sys.stderr)
+        return 2
+    
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, args.metrics_host)
+    
+    queue = get_video_job_queue(args.queue)
+    stop_event = threading.Event()
+    options = {
+        "visibility_timeout": args.visibility_timeout,
+        "poll_interval": args.poll_interval,
+        "max_jobs": args.max_jobs,
+        "exit_when_empty": args.exit_when_empty,
+        "stop_event": stop_event
+    }
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = [
+            executor.submit(run_worker, queue, gemini_key, openai_key, **options)
+            for _ in range(max(1, args.concurrency))
+        ]
+        try:
+            processed = sum(future.result() for future in futures)
+        except KeyboardInterrupt:
+            # Parar os laços dentro do bloco with, senão o shutdown do executor espera para sempre
+            stop_event.set()
+            print("Interrompido: concluindo as tarefas em andamento (Ctrl+C de novo para sair já).", file=sys.stderr)
+            try:
+                processed = sum(future.result() for future in futures)
+            except KeyboardInterrupt:
+                # Tarefas interrompidas voltam para a fila quando o arrendamento vencer
+                print(f"Encerrado sem concluir as tarefas em andamento. Fila: {queue.stats()}", file=sys.stderr)
+                os._exit(130)
+    print(f"Tarefas processadas: {processed}. Fila: {queue.stats()}", file=sys.stderr)
+    return 0
+
+def run_startup_report_command(args):
+    """Subcomando 'startup-report': mostra o custo de importação de cada provedor"""
+    registry = get_provider_registry()
+    module_seconds = time.perf_counter() - _SCRIPT_STARTED
+    if args.load_all:
+        for name in registry.modules:
+            if registry.available(name):
+                registry.load(name)
+    report = registry.report()
+    report["module_import_seconds"] = round(module_seconds, 3)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+def run_cli(argv=None):
+    """Ponto de entrada da linha de comando (python -m src.main <comando>)"""
+    parser = argparse.ArgumentParser(prog="python -m src.main", description="SpotQuest - execução sem interface")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    batch_parser = subparsers.add_parser("batch", help="Gera perguntas para várias URLs do YouTube")
+    batch_parser.add_argument("urls_file", help="Arquivo com uma URL por linha ('-' para stdin)")
+    batch_parser.add_argument("--concurrency", type=int, default=4, help="Número de vídeos processados em paralelo")
+    batch_parser.add_argument("--out", default="-", help="Arquivo JSONL de saída ('-' para stdout)")
+    batch_parser.add_argument("--num-questions", type=int, default=5)
+    batch_parser.add_argument("--question-type", choices=["dissertativa", "multipla_escolha"], default="dissertativa")
+    batch_parser.add_argument("--force-regenerate", action="store_true", help="Ignora o cache de perguntas")
+    batch_parser.add_argument("--bank", action="store_true", help="Modo banco de questões (use com --num-questions alto)")
+    batch_parser.add_argument("--token-budget", type=int, default=None, help="Orçamento de tokens da transcrição (0 = sem limite)")
+    batch_parser.add_argument("--gemini-key", default=None)
+    batch_parser.add_argument("--openai-key", default=None)
+    batch_parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Porta do endpoint /metrics do Prometheus (padrão: SPOTQUEST_METRICS_PORT)")
+    batch_parser.add_argument("--metrics-host", default=METRICS_HOST, help="Interface do endpoint /metrics (padrão: SPOTQUEST_METRICS_HOST ou 127.0.0.1)")
+    batch_parser.set_defaults(handler=run_batch_command)
+    
+    export_parser = subparsers.add_parser("export", help="Exporta o banco de questões salvo")
+    export_parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="jsonl")
+    export_parser.add_argument("--out", default="-", help="Arquivo de saída ('-' para stdout)")
+    export_parser.add_argument("--video-id", default=None)
+    export_parser.add_argument("--question-type", choices=["dissertativa", "multipla_escolha"], default=None)
+    export_parser.add_argument("--transcript-method", choices=TRANSCRIPT_METHODS, default=None)
+    export_parser.set_defaults(handler=run_export_command)
+    
+    enqueue_parser = subparsers.add_parser("enqueue", help="Adiciona URLs à fila durável dos workers")
+    enqueue_parser.add_argument("urls_file", help="Arquivo com uma URL por linha ('-' para stdin)")
+    enqueue_parser.add_argument("--queue", default=None, help="Arquivo SQLite da fila (padrão: SPOTQUEST_QUEUE_PATH)")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=QUEUE_MAX_ATTEMPTS)
+    enqueue_parser.add_argument("--num-questions", type=int, default=5)
+    enqueue_parser.add_argument("--question-type", choices=["dissertativa", "multipla_escolha"], default="dissertativa")
+    enqueue_parser.add_argument("--force-regenerate", action="store_true", help="Ignora o cache de perguntas")
+    enqueue_parser.add_argument("--bank", action="store_true", help="Modo banco de questões")
+    enqueue_parser.add_argument("--token-budget", type=int, default=None, help="Orçamento de tokens da transcrição (0 = sem limite)")
+    enqueue_parser.set_defaults(handler=run_enqueue_command)
+    
+    worker_parser = subparsers.add_parser("worker", help="Processa vídeos da fila durável")
+    worker_parser.add_argument("--queue", default=None, help="Arquivo SQLite da fila (padrão: SPOTQUEST_QUEUE_PATH)")
+    worker_parser.add_argument("--concurrency", type=int, default=1, help="Tarefas processadas em paralelo por este worker")
+    worker_parser.add_argument("--visibility-timeout", type=int, default=QUEUE_VISIBILITY_TIMEOUT)
+    worker_parser.add_argument("--poll-interval", type=float, default=QUEUE_POLL_SECONDS)
+    worker_parser.add_argument("--max-jobs", type=int, default=None, help="Encerra após processar este número de tarefas (por thread)")
+    worker_parser.add_argument("--exit-when-empty", action="store_true", help="Encerra quando a fila estiver vazia")
+    worker_parser.add_argument("--gemini-key", default=None)
+    worker_parser.add_argument("--openai-key", default=None)
+    worker_parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Porta do endpoint /metrics do Prometheus (padrão: SPOTQUEST_METRICS_PORT)")
+    worker_parser.add_argument("--metrics-host", default=METRICS_HOST, help="Interface do endpoint /metrics (padrão: SPOTQUEST_METRICS_HOST ou 127.0.0.1)")
+    worker_parser.set_defaults(handler=run_worker_command)
+    
+    startup_parser = subparsers.add_parser("startup-report", help="Mostra o tempo de importação dos provedores")
+    startup_parser.add_argument("--load-all", action="store_true", help="Importa todos os provedores instalados e mede cada um")
+    startup_parser.set_defaults(handler=run_startup_report_command)
+    
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+# Subcomandos aceitos pela linha de comando (qualquer outra execução abre a interface)
+CLI_COMMANDS = ("batch", "export", "enqueue", "worker", "startup-report")
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(run_cli())
     main()
\ No newline at end of file
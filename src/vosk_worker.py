@@ -0,0 +1,52 @@
+"""Funções executadas nos processos filhos do reconhecimento Vosk em paralelo
+
+Ficam fora do main.py porque o ProcessPoolExecutor envia a função ao filho pelo nome
+qualificado: o Streamlit reexecuta o main.py em um __main__ novo a cada interação, então
+uma função definida lá deixa de ser "a mesma" entre execuções e não pode ser serializada.
+Este módulo é importado uma única vez e não usa nada do Streamlit, cujas travas podem
+ter sido copiadas presas no fork.
+"""
+import importlib
+import json
+
+# Modelo herdado pelos processos filhos via fork (compartilha as páginas de memória do pai)
+_model = None
+_recognizer = None
+_sample_rate = None
+
+def share_model(model):
+    """Chamado no processo pai antes do fork, para que os filhos herdem o modelo já carregado"""
+    global _model
+    _model = model
+
+def init_worker(model_path, sample_rate):
+    """Inicializador do pool: resolve o vosk diretamente e carrega o modelo se não foi herdado"""
+    global _model, _recognizer, _sample_rate
+    vosk = importlib.import_module("vosk")
+    _recognizer = vosk.KaldiRecognizer
+    _sample_rate = sample_rate
+    if _model is None:
+        _model = vosk.Model(model_path)
+
+def recognize_chunk(args):
+    """Reconhece um trecho de PCM em um processo do pool, ajustando os tempos das palavras"""
+    offset_seconds, pcm = args
+    rec = _recognizer(_model, _sample_rate)
+    rec.SetWords(True)
+
+    parts = []
+    block_size = 8000
+    for i in range(0, len(pcm), block_size):
+        if rec.AcceptWaveform(pcm[i:i + block_size]):
+            parts.append(json.loads(rec.Result()))
+    parts.append(json.loads(rec.FinalResult()))
+
+    texts = [part.get("text", "") for part in parts if part.get("text")]
+    words = []
+    for part in parts:
+        for word in part.get("result", []):
+            word = dict(word)
+            word["start"] = round(word["start"] + offset_seconds, 2)
+            word["end"] = round(word["end"] + offset_seconds, 2)
+            words.append(word)
+    return " ".join(texts), words